@@ -1,7 +1,20 @@
 # kivy app (orbits)
 # uses planets module and orbits.kv
 
+import multiprocessing
+import os
+import queue
+from collections import deque
+from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib
+
+matplotlib.use("Agg")  # figures are only ever drawn off screen
+
 from kivy.app import App
+from kivy.clock import Clock
+from kivy.graphics.texture import Texture
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
 from kivy.properties import ObjectProperty
@@ -12,11 +25,177 @@ from kivy.uix.videoplayer import VideoPlayer
 from kivy.uix.textinput import TextInput
 from kivy.uix.togglebutton import ToggleButton
 from kivy.uix.accordion import Accordion
+from kivy.uix.image import Image
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from random import choice
 
 import planets
 
 
+# renders jobs one at a time in its own process, so the ui never waits on them
+# jobs are (job id, cache key, object, method name, args, kwargs) tuples and
+# finished files go through the render cache; events are sent back as
+# ("progress", id, done, total), ("preview", id, file), ("done", id, file)
+# or ("error", id, message)
+def render_worker(jobs, events):
+	planets.own_process_group()
+	planets.plt.switch_backend("Agg")
+	for job_id, key, obj, method, args, kwargs in iter(jobs.get, None):
+		def progress(done, total):
+			events.put(("progress", job_id, done, total))
+
+		def render(fn):
+			fn = getattr(obj, method)(*args, fname=fn, progress=progress, **kwargs)
+			if isinstance(fn, tuple):  # quick preview, then the full render
+				preview, full = fn
+				events.put(("preview", job_id, preview))
+				fn = full.result()
+			return fn
+
+		try:
+			fn = planets.render_cache.fetch(key, "mp4", render)
+		except Exception as ex:
+			events.put(("error", job_id, repr(ex)))
+		else:
+			events.put(("done", job_id, fn))
+
+
+# queue of renders fed to the worker process one job at a time
+# cancelling the running job kills the worker and its encoder, and the worker
+# is restarted for the next one; a worker that dies on its own fails its job
+# the same way; poll is called from the kivy clock and forwards events to
+# callback
+class RenderQueue:
+	def __init__(self, callback):
+		self.callback = callback
+		self.pending = deque()
+		self.current = None
+		self.next_id = 0
+		self.process = None
+		self.ctx = multiprocessing.get_context("spawn")
+
+	def start(self):
+		self.jobs = self.ctx.Queue()
+		self.events = self.ctx.Queue()
+		self.process = self.ctx.Process(
+			target=render_worker, args=(self.jobs, self.events), daemon=True)
+		self.process.start()
+
+	# queues method(*args, **kwargs) of obj, returns the job id
+	def submit(self, key, obj, method, args, kwargs):
+		self.next_id += 1
+		self.pending.append((self.next_id, key, obj, method, args, kwargs))
+		self.dispatch()
+		return self.next_id
+
+	def dispatch(self):
+		if self.current is not None or not self.pending:
+			return
+		if self.process is None or not self.process.is_alive():
+			self.start()
+		self.current = self.pending.popleft()
+		self.jobs.put(self.current)
+
+	# cancels a queued job, or the running one when job_id is None
+	def cancel(self, job_id=None):
+		for job in self.pending:
+			if job[0] == job_id:
+				self.pending.remove(job)
+				return
+		if self.current is None or job_id not in (None, self.current[0]):
+			return
+		self.stop()
+		self.dispatch()
+
+	# kills the worker and drops the partial files it was writing
+	def stop(self):
+		pid = self.process.pid
+		planets.kill_process_tree(self.process)
+		self.process = None
+		self.current = None
+		path = planets.render_cache.path
+		if os.path.isdir(path):
+			for name in os.listdir(path):
+				if f".{pid}.part" in name:
+					with suppress(OSError):
+						os.remove(os.path.join(path, name))
+
+	def poll(self, dt):
+		# checked before reading, so everything a dead worker sent is read first
+		process = self.process
+		alive = process is not None and process.is_alive()
+		while self.current is not None:
+			try:
+				event = self.events.get_nowait()
+			except queue.Empty:
+				break
+			if event[1] != self.current[0]:
+				continue  # from a job cancelled while its events were queued
+			if event[0] in ("done", "error"):
+				self.current = None
+			self.callback(*event)
+		if self.current is not None and self.process is process and not alive:
+			job_id = self.current[0]
+			code = self.process.exitcode
+			self.stop()
+			self.callback("error", job_id, f"render process exited with code {code}")
+		self.dispatch()
+
+
+# live views are prepared off the ui thread, one at a time
+live_builder = ThreadPoolExecutor(1)
+
+
+# figure of a live view, built by method(*args, f_ext="figure") of obj
+# computing the trajectory tables and drawing the static background (orbits,
+# star) on an agg canvas both happen here, so this runs on live_builder; the
+# figure is a plain Figure that pyplot never sees, safe to build off thread
+class LiveScene:
+	def __init__(self, obj, method, args):
+		self.fig, self.update, self.frames = getattr(obj, method)(*args, f_ext="figure")
+		self.agg = FigureCanvasAgg(self.fig)
+		for artist in self.update(0):
+			artist.set_animated(True)
+		self.agg.draw()
+		self.background = self.agg.copy_from_bbox(self.fig.bbox)
+
+	def close(self):
+		planets.close_figure(self.fig)
+
+
+# plays a LiveScene by drawing its frames straight into a texture on the clock
+# each frame only restores the scene's background and draws the artists update
+# returns, and the canvas's rgba buffer is blitted into the same texture, so
+# nothing is encoded, written or decoded
+# draw_artist does not project 3d artists, so they are projected here first
+class LiveView(Image):
+	def __init__(self, scene, interval, **kwargs):
+		super(LiveView, self).__init__(**kwargs)
+		self.scene = scene
+		self.frame = 0
+		w, h = scene.agg.get_width_height(physical=True)
+		self.texture = Texture.create(size=(w, h), colorfmt="rgba")
+		self.texture.flip_vertical()  # agg rows run top to bottom
+		self.event = Clock.schedule_interval(self.step, interval / 1000)
+		self.step(0)
+
+	def step(self, dt):
+		scene = self.scene
+		scene.agg.restore_region(scene.background)
+		for artist in scene.update(self.frame):
+			if hasattr(artist, "do_3d_projection"):
+				artist.do_3d_projection()
+			scene.fig.draw_artist(artist)
+		self.texture.blit_buffer(
+			scene.agg.buffer_rgba(), colorfmt="rgba", bufferfmt="ubyte")
+		self.canvas.ask_update()
+		self.frame = (self.frame + 1) % scene.frames
+
+	def stop(self):
+		self.event.cancel()
+		self.scene.close()
+
+
 # button to toggle collapse sidebar
 class CollapseBtn(Button):
 	def toggle_sidebar(self):
@@ -244,6 +423,8 @@ class AddMenu(BoxLayout):
 		self.add_widget(self.legend_loc)
 		self.three_d = CheckOption("3D? (#6, #7 only)")
 		self.add_widget(self.three_d)
+		self.live = CheckOption("Live view (#3, #4, #6, #7)")
+		self.add_widget(self.live)
 
 		self.submit_btn = SubmitBtn()
 		self.add_widget(self.submit_btn)
@@ -288,7 +469,8 @@ class Viewer(BoxLayout):
 			"label": not(bool(a["Hide axes labels"])),
 			"legend": not(bool(a["Hide legend"])),
 			"legend_loc": str(a["Legend location"]),
-			"3d": bool(a["3D? (#6, #7 only)"])
+			"3d": bool(a["3D? (#6, #7 only)"]),
+			"live": bool(a["Live view (#3, #4, #6, #7)"])
 		}
 
 		t = []
@@ -316,38 +498,141 @@ class Viewer(BoxLayout):
 		)
 		yrs = addt["yrs"]  # take from additional
 		fc = addt["facecolor"] if addt["facecolor"] != "" else "#000000"
-		fn = "temp"
+		if task == "5" and yrs <= 4:
+			yrs = 5
 
 		# change what generate button does according to task selected on sidebar
 		# if no task is selected it will do nothing
+		# animations show a quick low resolution preview while they render
+		preview = {"f_ext": "mp4", "preview": True}
 		if task == "1":
-			f = temp.task1(fc, "mp4", fn)
+			job = ("task1", (fc, "mp4"), {"preview": True})
 		elif task == "2":
-			f = temp.plot_orbits(fc, f_ext="mp4", fname=fn)
+			job = ("plot_orbits", (fc,), {"f_ext": "mp4"})
 		elif task == "3":
-			f = temp.animate_orbits(planet_y, yrs, fc, f_ext="mp4", fname=fn)
+			job = ("animate_orbits", (planet_y, yrs, fc), preview)
 		elif task == "4":
-			f = temp.animate_orbits_3d(planet_y, yrs, fc, f_ext="mp4", fname=fn)
+			job = ("animate_orbits_3d", (planet_y, yrs, fc), preview)
 		elif task == "5":
-			if yrs <= 4:
-				yrs = 5
-			f = temp.task5(planet_y, yrs, fc, "mp4", fn)
+			job = ("task5", (planet_y, yrs, fc, "mp4"), {"preview": True})
 		elif task == "6":
 			# option for 2d/3d
 			if addt["3d"] is True:
-				f = temp.spirograph_3d(planet_y, yrs, fc, f_ext="mp4", fname=fn)
+				job = ("spirograph_3d", (planet_y, yrs, fc), preview)
 			else:
-				f = temp.spirograph(planet_y, yrs, fc, f_ext="mp4", fname=fn)
+				job = ("spirograph", (planet_y, yrs, fc), preview)
 		elif task == "7":
 			# option for 2d/3d
 			if addt["3d"] is True:
-				f = temp.ptolemate_3d(planet_y, planet_c, yrs, fc, f_ext="mp4", fname=fn)
+				job = ("ptolemate_3d", (planet_y, planet_c, yrs, fc), preview)
 			else:
-				f = temp.ptolemate(planet_y, planet_c, yrs, fc, f_ext="mp4", fname=fn)
+				job = ("ptolemate", (planet_y, planet_c, yrs, fc), preview)
+
+		# live view draws the animation in the app as it plays, without a file
+		# the scene is built on live_builder and shown once ready, unless a
+		# newer request has come in by then
+		self.live_pending = None
+		if addt["live"] is True and task in ("3", "4", "6", "7"):
+			method, args, _ = job
+			name = f"Task {task}"
+			self.show_status(f"{name}: preparing live view")
+			future = live_builder.submit(LiveScene, temp, method, args)
+			self.live_pending = future
+			future.add_done_callback(
+				lambda f: Clock.schedule_once(lambda dt: self.live_ready(f, name)))
+			return
 
+		# identical requests are served from the render cache, keyed by the
+		# method and the arguments it is given, so fields a task does not read
+		# (e.g. the static planet outside task 7) cannot cause a miss
+		def ident(x):
+			if isinstance(x, planets.Planet):
+				return (x.name, x.cache_key())
+			return x
+
+		method, args, _ = job
+		key = planets.RenderCache.key(
+			temp.star is not None,
+			[ident(p) for p in temp.planets],
+			method,
+			[ident(x) for x in args],
+			"mp4")
+		f = planets.render_cache.get(key, "mp4")
+		if f is not None:
+			self.play(f)
+			return
+
+		# otherwise rendered in the background, several requests queue up
+		job_id = self.renders.submit(key, temp, *job)
+		self.names[job_id] = f"Task {task}"
+		self.show_status()
+
+	# shows a prepared live view, unless a newer request has replaced it
+	def live_ready(self, future, name):
+		try:
+			scene = future.result()
+		except Exception as ex:
+			if future is self.live_pending:
+				self.show_status(f"{name}: failed, {ex!r}")
+			return
+		if future is not self.live_pending:
+			scene.close()
+			return
+		self.live_pending = None
+		self.show_status(f"{name}: live")
+		self.show(LiveView(scene, 1000 / planets.RenderBudget().fps))
+
+	# swaps the finished render into the video player
+	def play(self, f):
+		self.show(VideoPlayer(source=f, state="play", options={"eos": "loop"}))
+
+	# replaces the video player or live view
+	def show(self, video):
+		if isinstance(self.video, LiveView):
+			self.video.stop()
 		self.remove_widget(self.video)
-		self.video = VideoPlayer(source=f, state="play", options={"eos": "loop"})
-		self.add_widget(self.video)
+		self.video = video
+		self.add_widget(self.video, 1)  # above the progress bar
+
+	# events from the render queue
+	def render_event(self, kind, job_id, *args):
+		name = self.names.get(job_id, "")
+		if kind == "progress":
+			done, total = args
+			self.show_status(f"{name}: {done}/{total} frames")
+			return
+		if kind == "preview":
+			self.show_status(f"{name}: preview")
+			self.play(args[0])
+			self.previews[job_id] = args[0]
+			return
+		if kind == "done":
+			self.show_status(f"{name}: done")
+			self.play(args[0])
+		else:
+			self.show_status(f"{name}: failed, {args[0]}")
+		self.names.pop(job_id, None)
+		self.drop_preview(job_id)
+
+	# previews are replaced by the full render, so are not kept
+	def drop_preview(self, job_id):
+		preview = self.previews.pop(job_id, None)
+		if preview is not None and os.path.exists(preview):
+			os.remove(preview)
+
+	def cancel(self, _, **kwargs):
+		if self.renders.current is not None:
+			job_id = self.renders.current[0]
+			self.names.pop(job_id, None)
+			self.renders.cancel()
+			self.drop_preview(job_id)
+			self.show_status("Cancelled")
+
+	def show_status(self, text=""):
+		queued = len(self.renders.pending)
+		if queued:
+			text = f"{text} ({queued} queued)" if text else f"{queued} queued"
+		self.status.text = text
 
 	def __init__(self, **kwargs):
 		super(Viewer, self).__init__(**kwargs)
@@ -357,6 +642,20 @@ class Viewer(BoxLayout):
 		self.gen_btn = GenerateBtn()
 		self.add_widget(self.gen_btn)
 		self.gen_btn.bind(on_press=self.generate)
+
+		# render progress and cancel button
+		self.renders = RenderQueue(self.render_event)
+		self.names = {}
+		self.previews = {}
+		self.live_pending = None  # future of the live view being prepared
+		Clock.schedule_interval(self.renders.poll, 0.1)
+		self.progress_bar = BoxLayout(size_hint_y=0.06, spacing=10)
+		self.status = Label(text="")
+		self.progress_bar.add_widget(self.status)
+		self.cancel_btn = Button(text="Cancel", size_hint_x=0.2)
+		self.cancel_btn.bind(on_press=self.cancel)
+		self.progress_bar.add_widget(self.cancel_btn)
+		self.add_widget(self.progress_bar)
 		self.video = VideoPlayer()
 		self.add_widget(self.video)
 
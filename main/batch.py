@@ -0,0 +1,207 @@
+# headless batch renderer (orbits)
+# renders the tasks listed in a json job file without any gui, e.g.
+#   python batch.py gallery.json -j 4 --timeout 1800
+# run from this folder, default file names are relative to it as in the tasks
+# uses the agg backend, so it runs on servers without a display
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import time
+from collections import deque
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import planets  # noqa: E402
+
+
+# preset star, planet or planetary system by name, e.g. "Earth", "Inner Planets"
+def preset(name):
+	body = next((x for x in planets.pre if x.name.lower() == name.lower()), None)
+	if body is None:
+		raise ValueError(f"unknown body {name!r}")
+	return body
+
+
+# planetary system of a job, either a preset "system" or a list of "bodies"
+# bodies may include the sun and whole systems, whose planets are added
+def job_system(job):
+	if "bodies" not in job:
+		return preset(job.get("system", "Solar System"))
+	star = None
+	bodies = []
+	for body in map(preset, job["bodies"]):
+		if isinstance(body, planets.Star):
+			star = body
+		elif isinstance(body, planets.PlanetarySystem):
+			bodies += body.planets
+		else:
+			bodies.append(body)
+	return planets.PlanetarySystem(job.get("name", "Custom"), star, bodies)
+
+
+# renders one job, returns the saved file
+# job keys: task (1 - 7), system or bodies, planet (tasks 3, 4: a single
+# planet's orbit), planet_y, planet_c, yrs, fc, three_d, line, format, fname,
+# workers, budget (keyword arguments of planets.RenderBudget) and frame
+# image formats (png etc.) save a still of one frame, the last by default
+def render(job):
+	task = int(job["task"])
+	system = job_system(job)
+	f_ext = job.get("format", "mp4")
+	fname = job.get("fname", "")
+	still = f_ext in planets.IMAGE_FORMATS and task != 2
+	if still and fname == "":
+		raise ValueError("still images need a fname")
+	result = animate(job, task, system, "figure" if still else f_ext, fname)
+	if not still:
+		return result
+	fig, update, frames = result
+	update(job.get("frame", frames - 1))
+	fn = f"{fname}.{f_ext}"
+	fig.savefig(fn)
+	planets.close_figure(fig)
+	return fn
+
+
+# shows, saves or builds the figure of (f_ext="figure") one job's task
+def animate(job, task, system, f_ext, fname):
+	fc = job.get("fc", "#333333")
+	yrs = job.get("yrs", 1)
+	workers = job.get("workers", 1)
+	budget = planets.RenderBudget(**job["budget"]) if "budget" in job else None
+	three_d = job.get("three_d", False)
+
+	planet_y = system.planets[-1]
+	if "planet_y" in job:
+		planet_y = preset(job["planet_y"])
+	planet_c = system.planets[0]
+	if "planet_c" in job:
+		planet_c = preset(job["planet_c"])
+	kwargs = dict(fc=fc, f_ext=f_ext, fname=fname, workers=workers)
+
+	if task == 1:
+		return system.task1(**kwargs)
+	elif task == 2:
+		return system.plot_orbits(fc, f_ext, fname)
+	elif task in (3, 4) and "planet" in job:
+		planet = preset(job["planet"])
+		method = planet.animate_3d if task == 4 else planet.animate_orbit
+		return method(f_ext, workers, budget=budget, fname=fname)
+	elif task == 3:
+		return system.animate_orbits(planet_y, yrs, budget=budget, **kwargs)
+	elif task == 4:
+		return system.animate_orbits_3d(planet_y, yrs, budget=budget, **kwargs)
+	elif task == 5:
+		return system.task5(planet_y, yrs, **kwargs)
+	elif task == 6:
+		line = job.get("line", False)
+		method = system.spirograph_3d if three_d is True else system.spirograph
+		return method(planet_y, yrs, line=line, budget=budget, **kwargs)
+	elif task == 7:
+		method = system.ptolemate_3d if three_d is True else system.ptolemate
+		return method(planet_y, planet_c, yrs, budget=budget, **kwargs)
+	raise ValueError(f"unknown task {task}")
+
+
+# runs in a job's own process, reporting (index, status, file, error)
+def run_job(index, job, results):
+	planets.own_process_group()
+	try:
+		fn = render(job)
+	except Exception as ex:
+		results.put((index, "error", None, repr(ex)))
+	else:
+		results.put((index, "ok", fn, None))
+
+
+# runs jobs with at most workers at once, each in a process of its own, so one
+# exceeding its timeout (seconds, "timeout" in the job overrides it) can be
+# killed, along with its encoder and frame pool, without affecting the others
+# returns one manifest record per job, in job order
+def run(jobs, workers=1, timeout=None):
+	methods = multiprocessing.get_all_start_methods()
+	ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+	results = ctx.Queue()
+	pending = deque(enumerate(jobs))
+	running = {}  # index: (process, start time)
+	records = [None] * len(jobs)
+
+	def finish(index, status, fn=None, error=None):
+		proc, start = running.pop(index)
+		proc.join()
+		records[index] = dict(
+			job=jobs[index],
+			status=status,
+			output=fn,
+			error=error,
+			seconds=round(time.perf_counter() - start, 3))
+		print(f"[{index}] {status} {fn or error or ''} ({records[index]['seconds']} s)")
+
+	try:
+		while pending or running:
+			while pending and len(running) < workers:
+				index, job = pending.popleft()
+				proc = ctx.Process(target=run_job, args=(index, job, results))
+				proc.start()
+				running[index] = (proc, time.perf_counter())
+
+			try:
+				result = results.get(timeout=0.5)
+			except queue.Empty:
+				pass
+			else:
+				if result[0] in running:  # not already timed out
+					finish(*result)
+
+			now = time.perf_counter()
+			for index, (proc, start) in list(running.items()):
+				limit = jobs[index].get("timeout", timeout)
+				if limit is not None and now - start > limit:
+					planets.kill_process_tree(proc)
+					finish(index, "timeout", error=f"exceeded {limit} s")
+				elif proc.exitcode not in (None, 0):
+					planets.kill_process_tree(proc)  # whatever it left running
+					finish(index, "error", error=f"exit code {proc.exitcode}")
+	finally:
+		for proc, _ in running.values():  # interrupted
+			planets.kill_process_tree(proc)
+	return records
+
+
+# job file: a list of jobs, or {"defaults": {...}, "jobs": [...]} where the
+# defaults are applied to every job
+def load_jobs(fn):
+	with open(fn) as f:
+		data = json.load(f)
+	if isinstance(data, list):
+		return data
+	defaults = data.get("defaults", {})
+	return [{**defaults, **job} for job in data["jobs"]]
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Render orbit tasks headlessly.")
+	parser.add_argument("jobs", help="json job file")
+	parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+	parser.add_argument("--timeout", type=float, default=None, help="seconds per job")
+	parser.add_argument("--manifest", default="manifest.json")
+	args = parser.parse_args()
+
+	start = time.perf_counter()
+	records = run(load_jobs(args.jobs), args.workers, args.timeout)
+	with open(args.manifest, "w") as f:
+		json.dump(
+			dict(seconds=round(time.perf_counter() - start, 3), jobs=records), f, indent=2)
+
+	failed = sum(record["status"] != "ok" for record in records)
+	print(f"{len(records) - failed}/{len(records)} rendered, manifest: {args.manifest}")
+	return 1 if failed else 0
+
+
+if __name__ == "__main__":
+	raise SystemExit(main())
@@ -2,56 +2,372 @@
 
 # saving animations requires ffmpeg, otherwise animations can just be displayed
 
+import base64
+import hashlib
+import multiprocessing
+import os
+import re
+import signal
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager, suppress
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib import colors as mcolors
+from matplotlib import image as mpimg
 from matplotlib.animation import FuncAnimation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
 from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+
+# solves kepler's equation M = E - e*sin(E) for the eccentric anomaly E
+# works elementwise on arrays, broadcasting mean anomaly against eccentricity
+# halley's method from danby's starting guess, stopping once every correction
+# is below tol, so near-circular orbits take 1-2 rounds and e > 0.8 still converges
+# out: optional preallocated array to write E into
+# dtype: np.float32 for a faster, less precise solve
+def solve_kepler(M, eccentricity, tol=1e-12, max_iter=50, out=None, dtype=np.float64):
+	# reduce to [-pi, pi) in double precision before any downcast
+	M = np.remainder(np.asarray(M, dtype=np.float64) + np.pi, 2 * np.pi) - np.pi
+	M = M.astype(dtype, copy=False)
+	e = np.asarray(eccentricity, dtype=dtype)
+	tol = max(tol, 4 * np.finfo(dtype).eps)
+	shape = np.broadcast_shapes(M.shape, e.shape)
+	if out is None:
+		out = np.empty(shape, dtype=dtype)
+	E = out
+
+	# danby's starter: E = M + 0.85 * e * sign(sin(M))
+	E[...] = np.sign(np.sin(M))
+	E *= 0.85 * e
+	E += M
+
+	for _ in range(max_iter):
+		es = e * np.sin(E)
+		f1 = 1 - e * np.cos(E)
+		f = E - es - M
+		dE = f / (f1 - 0.5 * f * es / f1)  # halley step
+		E -= dE
+		if np.all(np.abs(dE) < tol):
+			break
+	return E
+
+
+# batched solver: true anomaly and heliocentric distance of every body at every time
+# time broadcasts against the orbital elements, e.g. time of shape (frames,)
+# with elements of shape (planets, 1) gives (planets, frames) arrays
+# mean_anomaly: phase at time 0 in radians, broadcasting like the elements
+# out: optional (theta, r) pair of preallocated arrays
+def kepler_batch(
+	time,
+	sm_axis,
+	period,
+	eccentricity,
+	mean_anomaly=0,
+	tol=1e-12,
+	out=None,
+	dtype=np.float64
+):
+	M = 2 * np.pi / np.asarray(period, dtype=np.float64) * time  # mean anomaly
+	M = M + np.asarray(mean_anomaly, dtype=np.float64)
+	e = np.asarray(eccentricity, dtype=dtype)
+	theta, r = (None, None) if out is None else out
+
+	E = solve_kepler(M, e, tol=tol, out=theta, dtype=dtype)
+
+	a = np.asarray(sm_axis, dtype=dtype)
+	if r is None:
+		r = np.empty(E.shape, dtype=dtype)
+	np.multiply(e, np.cos(E), out=r)
+	np.subtract(1, r, out=r)
+	r *= a  # heliocentric distance
+
+	# true anomaly theta, written over E
+	np.arctan2(np.sqrt(1 + e) * np.sin(E / 2), np.sqrt(1 - e) * np.cos(E / 2), out=E)
+	E *= 2
+
+	return E, r
+
+
+# perifocal to ecliptic rotation Rz(node) Rx(inclination) Rz(perihelion)
+# angles in degrees, as arrays of the same shape for a stack of (..., 3, 3)
+def rotation_matrix(node, inclination, perihelion):
+	o, i, w = np.deg2rad([node, inclination, perihelion])
+	co, so = np.cos(o), np.sin(o)
+	ci, si = np.cos(i), np.sin(i)
+	cw, sw = np.cos(w), np.sin(w)
+	return np.stack([
+		np.stack([co * cw - so * sw * ci, -co * sw - so * cw * ci, so * si], -1),
+		np.stack([so * cw + co * sw * ci, -so * sw + co * cw * ci, -co * si], -1),
+		np.stack([sw * si, cw * si, ci], -1)], -2)
+
+
+# positions from true anomaly theta and distance r, shape theta.shape + (3,)
+# in the orbital plane (z = 0), or rotated into the ecliptic frame when
+# given a (3, 3) rotation, or a (planets, 3, 3) stack for (planets, times) input
+def positions(theta, r, rotation=None):
+	table = np.empty(np.shape(theta) + (3,), dtype=r.dtype)
+	table[..., 0] = r * np.cos(theta)
+	table[..., 1] = r * np.sin(theta)
+	table[..., 2] = 0
+	if rotation is None:
+		return table
+	return np.matmul(table, np.swapaxes(rotation, -1, -2))  # one batched matmul
+
+
+# positions rotated into the ecliptic frame, as for positions()
+# unless three_d, they are projected onto the ecliptic (z = 0), so 2d views
+# show every planet at its true longitude, in the same frame as 3d ones
+def ecliptic(theta, r, rotation, three_d=False):
+	table = positions(theta, r, rotation)
+	if three_d is not True:
+		table[..., 2] = 0
+	return table
+
+
+# mean anomaly in radians from true anomaly theta in degrees
+# via the eccentric anomaly, works elementwise on arrays
+def mean_anomaly(theta, eccentricity):
+	half = np.deg2rad(theta) / 2
+	e = np.asarray(eccentricity, dtype=np.float64)
+	E = 2 * np.arctan2(np.sqrt(1 - e) * np.sin(half), np.sqrt(1 + e) * np.cos(half))
+	return E - e * np.sin(E)
+
+
+G = 4 * np.pi ** 2  # gravitational constant, AU^3 / (solar mass * year^2)
+
+
+# heliocentric positions and velocities, (bodies, 3) each, from orbital elements
+# mean_anomaly in radians, mu = G * (star mass + body mass) of each body
+# rotated into the ecliptic frame by a (bodies, 3, 3) stack, otherwise in z = 0
+def state_vectors(sm_axis, eccentricity, mean_anomaly, mu, rotation=None):
+	a = np.asarray(sm_axis, dtype=np.float64)
+	e = np.asarray(eccentricity, dtype=np.float64)
+	E = solve_kepler(np.asarray(mean_anomaly, dtype=np.float64), e)
+	b = a * np.sqrt(1 - e ** 2)  # semi-minor axis
+	dE = np.sqrt(mu / a ** 3) / (1 - e * np.cos(E))  # rate of eccentric anomaly
+	pos = np.zeros(a.shape + (3,))
+	vel = np.zeros(a.shape + (3,))
+	pos[..., 0] = a * (np.cos(E) - e)
+	pos[..., 1] = b * np.sin(E)
+	vel[..., 0] = -a * np.sin(E) * dE
+	vel[..., 1] = b * np.cos(E) * dE
+	if rotation is not None:
+		rotation = np.swapaxes(rotation, -1, -2)
+		pos = np.matmul(pos[..., None, :], rotation)[..., 0, :]
+		vel = np.matmul(vel[..., None, :], rotation)[..., 0, :]
+	return pos, vel
 
 
 # returns true anomaly and heliocentric distance as a function of time
-# solves kepler's equation using kepler's 1621 fixed-point iteration
-def kepler_eq(time, sm_axis, period, eccentricity):
-	n = 2 * np.pi / period  # mean motion
-	M = n * time  # mean anomaly
+# solves kepler's equation with the batched solver above
+def kepler_eq(time, sm_axis, period, eccentricity, mean_anomaly=0):
+	theta, r = kepler_batch(time, sm_axis, period, eccentricity, mean_anomaly)
+	if theta.ndim == 0:
+		return theta[()], r[()]
+	return theta, r
 
-	# kepler's equation: E = M + eccentricity * sin(E)
-	e = eccentricity
-	E = M
-	for _ in range(10):  # 10 iterations balances accuracy with speed
-		E = M + e * np.sin(E)  # eccentric anomaly
 
-	# true anomaly theta
-	theta = 2 * np.arctan(np.sqrt((1 + e) / (1 - e)) * np.tan(E / 2))
-	a = sm_axis
-	r = a * (1 - e * np.cos(E))  # heliocentric distance
+# data units per pixel of ax, for turning a pixel tolerance into AU
+# uses the view limits once they have been fixed, otherwise the given extent
+def pixel_tolerance(ax, extent, px=0.5):
+	if not ax.get_autoscale_on():
+		extent = max(np.ptp(ax.get_xlim()), np.ptp(ax.get_ylim()))
+	bbox = ax.get_window_extent()
+	return extent / max(min(bbox.width, bbox.height), 1) * px
 
-	return theta, r
+
+# closed ellipse sampled evenly in eccentric anomaly, returns (theta, r)
+# an ellipse is a squashed circle of radius a, so a chord spanning dE deviates
+# from the curve by at most a * dE ** 2 / 8; the step is the largest within tol
+def ellipse_samples(sm_axis, eccentricity, tol, min_points=16):
+	step = np.sqrt(8 * tol / sm_axis)
+	n = max(min_points, int(np.ceil(2 * np.pi / step)))
+	E = np.linspace(0, 2 * np.pi, n + 1)
+	e = eccentricity
+	theta = 2 * np.arctan2(np.sqrt(1 + e) * np.sin(E / 2), np.sqrt(1 - e) * np.cos(E / 2))
+	return theta, sm_axis * (1 - e * np.cos(E))
+
+
+# samples the curve f(time) -> (times, dims) on [t0, t1] by recursive subdivision
+# an interval is split while its midpoint lies further than tol from the chord,
+# every pass evaluates only the intervals split in the previous one
+# returns the sample times and the points on the curve
+def adaptive_samples(f, t0, t1, tol, n=16, depth=16):
+	t = np.linspace(t0, t1, n + 1)
+	p = f(t)
+	active = np.arange(n)
+	for _ in range(depth):
+		mid = (t[active] + t[active + 1]) / 2
+		pm = f(mid)
+		err = np.linalg.norm(pm - (p[active] + p[active + 1]) / 2, axis=-1)
+		split = err > tol
+		if not split.any():
+			break
+		i = active[split]
+		t = np.insert(t, i + 1, mid[split])
+		p = np.insert(p, i + 1, pm[split], axis=0)
+		i = i + np.arange(i.size)  # split intervals after the insertions
+		active = np.concatenate([i, i + 1])
+	return t, p
+
+
+# cumulative composite simpson integral of evenly spaced samples f along the
+# last axis, which must have an odd length; h is the spacing and may broadcast
+# every second node sums whole pairs of intervals, the nodes in between add
+# simpson's half step onto the previous one, all through strided slices
+def cumulative_simpson(f, h, out=None):
+	if out is None:
+		out = np.empty(f.shape)
+	f0, f1, f2 = f[..., :-2:2], f[..., 1::2], f[..., 2::2]
+	out[..., 0] = 0
+	np.cumsum(f0 + 4 * f1 + f2, axis=-1, out=out[..., 2::2])
+	out[..., 1::2] = out[..., :-1:2] + (5 * f0 + 8 * f1 - f2) / 4
+	out *= h / 3
+	return out
+
+
+# time taken to sweep from theta[..., 0] to theta, in the units of period
+# theta in radians along the last axis, elements broadcast as (planets, 1) columns
+# exact uses kepler's equation in closed form, with the eccentric anomaly written
+# so it stays continuous over any number of revolutions; otherwise kepler's
+# second law is integrated with simpson's rule over evenly spaced theta
+def kepler_time(theta, period, eccentricity, exact=True, out=None):
+	theta = np.asarray(theta, dtype=np.float64)
+	e = np.asarray(eccentricity, dtype=np.float64)
+	scale = np.asarray(period, dtype=np.float64) / (2 * np.pi)
+	if exact is True:
+		beta = e / (1 + np.sqrt(1 - e ** 2))
+		E = np.arctan2(beta * np.sin(theta), 1 + beta * np.cos(theta), out=out)
+		E *= -2
+		E += theta  # eccentric anomaly
+		E -= e * np.sin(E)  # mean anomaly
+		E -= E[..., :1].copy()
+		E *= scale
+		return E
+	h = (theta[..., 1:2] - theta[..., :1])
+	f = (1 + e * np.cos(theta)) ** -2
+	f *= scale * (1 - e ** 2) ** (3 / 2)  # dt / dtheta
+	return cumulative_simpson(f, h, out=out)
+
+
+# evenly spaced true anomalies from ta covering whole revolutions of yrs
+# d is rounded up to an odd count so simpson's rule can pair the intervals
+def revolutions(yrs, period, d, ta=0):
+	n = np.maximum(np.ceil(np.asarray(yrs) / period), 1)
+	return ta + 2 * np.pi * n[..., None] * np.linspace(0, 1, d + 1 - d % 2)
 
 
 # task 5: uses kepler ii but using integrals instead of iteration
-def kepler2(yrs, sm_axis, period, eccentricity, d, ta=0):
+# returns the polar angle at d even times, the sampled angles and the distance
+def kepler2(yrs, sm_axis, period, eccentricity, d, ta=0, exact=True):
 	time = np.linspace(0, yrs, d)
-	a = sm_axis
 	e = eccentricity
-	n = np.floor(time[-1] / period)
-	theta = np.linspace(ta, 2 * np.pi * n + ta, d)
-	f = (1 - e * np.cos(theta)) ** -2
-	c = [1] + [4 if x % 2 == 0 else 2 for x in range(len(theta) - 2)] + [1]
-	t = period * (1 - e ** 2) ** (3 / 2) / (6 * np.pi) / d * np.cumsum(c * f)
-	i = np.interp(t, theta, time)
-	r = a * (1 - e ** 2) / (1 + e * np.cos(i))
+	theta = revolutions(yrs, period, d, ta)
+	i = np.interp(time, kepler_time(theta, period, e, exact), theta)
+	r = sm_axis * (1 - e ** 2) / (1 + e * np.cos(i))
 	return i, theta, r
 
 
-def task5(yrs, period, eccentricity, d=1000, ta=0):
-	e = eccentricity
+# polar angle at d even times over yrs
+def task5(yrs, period, eccentricity, d=1000, ta=0, exact=True):
 	time = np.linspace(0, yrs, d)
-	n = np.ceil(time[-1] / period)
-	theta = np.linspace(ta, 2 * np.pi * n + ta, d)
-	f = (1 - e * np.cos(theta)) ** -2
-	c = [1] + [4 if x % 2 == 0 else 2 for x in range(len(theta) - 2)] + [1]
-	t = period * (1 - e ** 2) ** (3 / 2) / (6 * np.pi) / d * np.cumsum(c * f)
-	return np.interp(t, theta, time)
+	theta = revolutions(yrs, period, d, ta)
+	return np.interp(time, kepler_time(theta, period, eccentricity, exact), theta)
+
+
+# jpl horizons osculating element tables, as in the data folder
+# https://ssd.jpl.nasa.gov/horizons/app.html#/
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+AU_KM = 1.495978707e8  # astronomical unit in km
+JULIAN_YEAR = 365.25  # in days
+PRESET_EPOCH = 2460170.5  # julian day of the preset planets, 2023-Aug-14 00:00 TDB
+
+# one row per epoch, distances in AU, angles in degrees, times in days
+# JD: julian day (TDB), EC: eccentricity, QR: periapsis distance,
+# IN: inclination, OM: longitude of ascending node, W: argument of periapsis,
+# Tp: time of periapsis (JD), N: mean motion (deg/day), MA: mean anomaly,
+# TA: true anomaly, A: semi-major axis, AD: apoapsis distance, PR: period
+HORIZONS_FIELDS = [
+	"JD", "EC", "QR", "IN", "OM", "W", "Tp", "N", "MA", "TA", "A", "AD", "PR"]
+HORIZONS_DTYPE = np.dtype([(f, np.float64) for f in HORIZONS_FIELDS])
+
+
+def horizons_file(name):
+	return os.path.join(DATA, f"horizons_results_{name.lower()}.txt")
+
+
+# parses the $$SOE to $$EOE block of a horizons osculating elements file
+# into a structured array, converting km/s units to AU and days
+def parse_horizons(fn):
+	with open(fn) as f:
+		text = f.read()
+	units = re.search(r"Output units\s*:\s*([A-Z]+)-([A-Z]+)", text)
+	block = text[text.index("$$SOE") + 5:text.index("$$EOE")]
+
+	jd = re.findall(r"^\s*(\d+\.\d+)\s*=", block, re.MULTILINE)
+	values = re.findall(r"[A-Za-z]\s*=\s*([-+]?\d[^\s]*)", block)
+	values = np.array(values, dtype=np.float64).reshape(len(jd), 12)
+
+	data = np.empty(len(jd), dtype=HORIZONS_DTYPE)
+	data["JD"] = np.array(jd, dtype=np.float64)
+	for c, field in enumerate(HORIZONS_FIELDS[1:]):
+		data[field] = values[:, c]
+
+	length, time = units.groups() if units is not None else ("KM", "S")
+	if length == "KM":
+		for field in ["QR", "A", "AD"]:
+			data[field] /= AU_KM
+	if time == "S":
+		data["N"] *= 86400
+		data["PR"] /= 86400
+	return data
+
+
+# loads a horizons file, caching the parsed table next to it as a .npy file
+# the cache is memory-mapped and only re-parsed when the text file is newer
+def load_horizons(fn, cache=True):
+	if cache is False:
+		return parse_horizons(fn)
+	npy = f"{os.path.splitext(fn)[0]}.npy"
+	try:
+		if os.path.getmtime(npy) >= os.path.getmtime(fn):
+			return np.load(npy, mmap_mode="r")
+	except OSError:
+		pass
+	data = parse_horizons(fn)
+	try:
+		np.save(npy, data)
+	except OSError:  # read-only data folder, just skip the cache
+		pass
+	return data
+
+
+# planet built from the horizons elements at the epoch nearest to julian day jd
+# uses the first epoch in the file if jd is None
+# fn defaults to the data folder file for the planet's name
+def horizons_planet(name, jd=None, fn=""):
+	if fn == "":
+		fn = horizons_file(name)
+	data = load_horizons(fn)
+	k = 0 if jd is None else int(np.abs(data["JD"] - jd).argmin())
+	row = data[k]
+	return Planet(
+		name=name,
+		sm_axis=float(row["A"]),
+		period=float(row["PR"]) / JULIAN_YEAR,
+		eccentricity=float(row["EC"]),
+		inclination=float(row["IN"]),
+		true_anomaly=float(row["TA"]),
+		node=float(row["OM"]),
+		perihelion=float(row["W"]))
 
 
 def sort_p(planets):
@@ -62,12 +378,546 @@ def sort_p(planets):
 	return t
 
 
+# segments joining every unique pair of planets at every time
+# takes a (planets, times, 3) trajectory table, returns (times, pairs, 2, dims)
+def pair_segments(pos, dims=2):
+	b, d = np.triu_indices(len(pos), 1)
+	seg = np.stack([pos[b, :, :dims], pos[d, :, :dims]], axis=2)
+	return np.ascontiguousarray(seg.swapaxes(0, 1))
+
+
+# clips (n, 2, 2) segments to the box [lo, hi] on both axes (liang-barsky)
+# returns the clipped segments and a mask of those with any part inside
+def clip_segments(segments, lo, hi):
+	p0 = segments[:, 0]
+	dp = segments[:, 1] - p0
+	t0 = np.zeros(len(segments))
+	t1 = np.ones(len(segments))
+	with np.errstate(divide="ignore", invalid="ignore"):
+		for d in range(2):
+			a = (lo[d] - p0[:, d]) / dp[:, d]
+			b = (hi[d] - p0[:, d]) / dp[:, d]
+			inside = (p0[:, d] >= lo[d]) & (p0[:, d] <= hi[d])
+			flat = dp[:, d] == 0  # parallel to this axis: all in or all out
+			t0 = np.where(flat, np.where(inside, t0, 1), np.maximum(t0, np.minimum(a, b)))
+			t1 = np.where(flat, np.where(inside, t1, 0), np.minimum(t1, np.maximum(a, b)))
+	keep = t0 <= t1
+	t0, t1 = t0[keep, None], t1[keep, None]
+	p0, dp = p0[keep], dp[keep]
+	return np.stack([p0 + t0 * dp, p0 + t1 * dp], axis=1), keep
+
+
+# draws line segments into an accumulation buffer of shape (height, width)
+# segments: (n, 2, 2) array in pixel coordinates (column, row)
+# each segment is clipped to the image and sampled at every pixel it crosses
+# along its major axis (wu's algorithm), every sample being split between the
+# 2 nearest pixels across it for anti-aliasing; all deposits of a chunk of
+# samples go into the image in a single bincount
+# deposits are additive optical depth, so 1 - exp(-out) gives the coverage of
+# overlapping lines of the given alpha, as if composited one over another
+def rasterize_segments(segments, shape, alpha=0.2, out=None, chunk=1 << 23):
+	h, w = shape
+	if out is None:
+		out = np.zeros(shape, dtype=np.float32)
+	depth = -np.log(1 - alpha)
+
+	# a one pixel border either side catches the deposits at the edges
+	segments, _ = clip_segments(np.asarray(segments, dtype=np.float64), (-1, -1), (w, h))
+	segments += 1
+	pw = w + 3
+	image = np.zeros((h + 3) * pw)
+	dp = segments[:, 1] - segments[:, 0]
+	steep = np.abs(dp[:, 1]) > np.abs(dp[:, 0])
+
+	# mostly horizontal segments step along columns, steep ones along rows
+	for group, major, strides, top in (
+		(~steep, 0, (1, pw), h + 1),
+		(steep, 1, (pw, 1), w + 1)
+	):
+		seg = segments[group][..., [major, 1 - major]]  # (major, minor) coordinates
+		flip = seg[:, 1, 0] < seg[:, 0, 0]
+		seg[flip] = seg[flip, ::-1]  # major coordinate increasing
+		d = seg[:, 1] - seg[:, 0]
+		length = np.hypot(d[:, 0], d[:, 1])
+		slope = np.divide(d[:, 1], d[:, 0], out=np.zeros(len(d)), where=d[:, 0] > 0)
+
+		# pixels crossed along the major axis, or the nearest one for short segments
+		first = np.ceil(seg[:, 0, 0])
+		n = np.floor(seg[:, 1, 0]) - first + 1
+		short = n < 1
+		first[short] = np.rint(seg[short, :, 0].mean(axis=1))
+		n = np.maximum(n, 1).astype(np.int64)
+		intercept = (seg[:, 0, 1] - seg[:, 0, 0] * slope).astype(np.float32)
+		slope = slope.astype(np.float32)
+		wgt = (depth * length / n).astype(np.float32)
+		ends = np.cumsum(n)
+
+		# process a bounded number of samples at a time
+		start = 0
+		while start < len(n):
+			stop = max(np.searchsorted(ends, ends[start] - n[start] + chunk), start + 1)
+			nn = n[start:stop]
+			offset = (first[start:stop] - (np.cumsum(nn) - nn)).astype(np.int32)
+			u = np.arange(int(nn.sum()), dtype=np.int32) + np.repeat(offset, nn)
+			v = u.astype(np.float32)
+			v *= np.repeat(slope[start:stop], nn)
+			v += np.repeat(intercept[start:stop], nn)
+			np.clip(v, 0, top, out=v)
+			f = np.repeat(wgt[start:stop], nn)
+
+			v0 = v.astype(np.int32)  # floor, as v >= 0
+			v -= v0
+			base = u * strides[0] + v0 * strides[1]
+			image += np.bincount(
+				np.concatenate([base, base + strides[1]]),
+				weights=np.concatenate([f * (1 - v), f * v]),
+				minlength=image.size)
+			start = stop
+	out += image.reshape(h + 3, pw)[1:h + 1, 1:w + 1]
+	return out
+
+
+# formats saved with savefig rather than encoded as video
+IMAGE_FORMATS = ("png", "svg", "pdf", "jpg", "jpeg", "eps")
+
+
+# figure for a render: a pyplot figure when it is to be shown on screen,
+# otherwise a plain Figure on its own agg canvas that pyplot never sees, so
+# renders running in separate threads share no global state
+def new_figure(f_ext="", **kwargs):
+	if f_ext == "":
+		return plt.figure(**kwargs)
+	fig = Figure(**kwargs)
+	FigureCanvasAgg(fig)
+	return fig
+
+
+# closes a figure from new_figure, only shown figures are known to pyplot
+def close_figure(fig):
+	if fig.canvas.manager is not None:
+		plt.close(fig)
+
+
+# text artist for the time shown on each frame
+# kept inside the axes so blitting redraws it along with the moving bodies
+def time_label(ax, fc):
+	r, g, b = mcolors.to_rgb(fc)
+	color = "k" if 0.299 * r + 0.587 * g + 0.114 * b > 0.5 else "w"
+	if ax.name == "3d":
+		return ax.text2D(0.02, 0.98, "", transform=ax.transAxes, va="top", color=color)
+	return ax.text(0.02, 0.98, "", transform=ax.transAxes, va="top", color=color)
+
+
+# ffmpeg command reading raw rgba frames of size w x h from stdin
+def ffmpeg_args(fn, w, h, fps):
+	cmd = [
+		plt.rcParams["animation.ffmpeg_path"], "-y", "-loglevel", "error",
+		"-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{w}x{h}", "-r", f"{fps}",
+		"-i", "pipe:"]
+	if fn.endswith(".gif"):
+		cmd += ["-filter_complex", "split [a][b];[a] palettegen [p];[b][p] paletteuse"]
+	else:
+		cmd += [
+			"-vcodec", "h264", "-pix_fmt", "yuv420p",
+			"-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+	return cmd + [fn]
+
+
+# ffmpeg process encoding the raw rgba frames written to the yielded stdin
+# the video goes to a temporary name next to fn, renamed to fn only once ffmpeg
+# succeeds, so a failed or interrupted render leaves no truncated file behind
+# ffmpeg exiting early or failing raises CalledProcessError with its error
+# output, rather than the BrokenPipeError of the next write
+@contextmanager
+def ffmpeg_pipe(fn, w, h, fps):
+	root, ext = os.path.splitext(fn)
+	temp = f"{root}.part{ext}"
+	cmd = ffmpeg_args(temp, w, h, fps)
+	with tempfile.TemporaryFile() as log:
+		proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=log)
+		try:
+			try:
+				yield proc.stdin
+				proc.stdin.close()
+			except BrokenPipeError:
+				pass  # ffmpeg has exited, its error is raised below
+			except BaseException:
+				proc.kill()  # rendering failed, the video is discarded
+				raise
+			finally:
+				with suppress(BrokenPipeError):
+					proc.stdin.close()
+				proc.wait()
+			if proc.returncode != 0:
+				log.seek(0)
+				raise subprocess.CalledProcessError(
+					proc.returncode, cmd, stderr=log.read().decode(errors="replace"))
+			os.replace(temp, fn)
+		finally:
+			if os.path.exists(temp):
+				os.remove(temp)
+
+
+# called first thing in a worker process, so the processes it starts (ffmpeg,
+# frame rendering pools) share a process group that kill_process_tree can end
+def own_process_group():
+	if hasattr(os, "setpgid"):
+		os.setpgid(0, 0)
+
+
+# kills a multiprocessing worker together with the processes it started
+# terminating the worker alone would leave its ffmpeg encoder running
+def kill_process_tree(process):
+	if os.name == "nt":
+		subprocess.run(
+			["taskkill", "/F", "/T", "/PID", str(process.pid)],
+			stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	else:
+		with suppress(ProcessLookupError, PermissionError):
+			os.killpg(process.pid, signal.SIGKILL)
+	process.kill()  # in case it had not made its own group yet
+	process.join()
+
+
+# saves an animation by drawing each frame on an agg canvas and piping it
+# straight into ffmpeg, bypassing matplotlib's writer classes
+# the renderer's buffer is reused for every frame and written without copying
+# progress(done, total) is called after each frame is written
+def save_stream(fig, update, frames, fps, fn, progress=None):
+	canvas = FigureCanvasAgg(fig)
+	canvas.draw()
+	w, h = canvas.get_width_height(physical=True)
+	with ffmpeg_pipe(fn, w, h, fps) as stdin:
+		for frame in range(frames):
+			update(frame)
+			canvas.draw()
+			stdin.write(canvas.buffer_rgba())
+			if progress is not None:
+				progress(frame + 1, frames)
+	return fn
+
+
+# writes an html5 video tag with an embedded mp4
+# the video is encoded to a temporary file and base64-encoded into the html
+# in chunks, so it is never held in memory as one string
+def save_html(fig, update, frames, fps, fn, progress=None):
+	with tempfile.TemporaryDirectory() as d:
+		video = save_stream(
+			fig, update, frames, fps, os.path.join(d, "temp.mp4"), progress)
+		w, h = fig.canvas.get_width_height()
+		with open(video, "rb") as src, open(fn, "w") as f:
+			f.write(f'<video width="{w}" height="{h}" controls autoplay loop>\n')
+			f.write('  <source type="video/mp4" src="data:video/mp4;base64,')
+			chunk = src.read(3 << 16)  # multiple of 3, so chunks encode independently
+			while chunk:
+				f.write(base64.b64encode(chunk).decode("ascii"))
+				chunk = src.read(3 << 16)
+			f.write('">\n  Your browser does not support the video tag.\n</video>\n')
+	return fn
+
+
+# figure and update function of the animation a worker process renders
+_worker = {}
+
+
+def _init_worker(job):
+	obj, method, args, kwargs = job
+	fig, update, _ = getattr(obj, method)(*args, f_ext="figure", **kwargs)
+	_worker["fig"] = fig
+	_worker["update"] = update
+
+
+# renders frames start to stop - 1, returns width, height and raw rgba bytes
+def _render_frames(start, stop):
+	fig = _worker["fig"]
+	update = _worker["update"]
+	buf = bytearray()
+	for frame in range(start, stop):
+		update(frame)
+		fig.canvas.draw()
+		buf += fig.canvas.buffer_rgba()
+	w, h = fig.canvas.get_width_height(physical=True)
+	return w, h, bytes(buf)
+
+
+# saves an animation by rendering its frames across a pool of processes
+# each worker rebuilds the figure from job = (object, method name, args, kwargs)
+# and renders blocks of frames to raw rgba buffers, which are streamed in order
+# into one ffmpeg process, with at most 2 blocks per worker held in memory
+# progress(done, total) is called after each block is written
+def save_parallel(job, frames, fps, fn, workers, block=25, progress=None):
+	methods = multiprocessing.get_all_start_methods()
+	ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+	starts = iter(range(0, frames, block))
+	done = 0
+	with ProcessPoolExecutor(
+		workers,
+		mp_context=ctx,
+		initializer=_init_worker,
+		initargs=(job,)
+	) as pool:
+		pending = deque()
+
+		def submit():
+			start = next(starts, None)
+			if start is not None:
+				pending.append(pool.submit(_render_frames, start, min(start + block, frames)))
+
+		for _ in range(2 * workers):
+			submit()
+		if not pending:
+			return fn
+		w, h, _ = pending[0].result()  # frame size, from the first block
+		with ffmpeg_pipe(fn, w, h, fps) as stdin:
+			while pending:
+				w, h, buf = pending.popleft().result()
+				submit()
+				stdin.write(buf)
+				done += len(buf) // (w * h * 4)
+				if progress is not None:
+					progress(done, frames)
+	return fn
+
+
+# frame count and playback speed of an animation spanning some simulated years
+# by default one second of video per year of planet_y at 50 fps; duration sets
+# the length in seconds instead, days_per_frame the simulated time step, and
+# max_frames caps the count, lowering the fps to keep the same duration
+class RenderBudget:
+	def __init__(self, fps=50, duration=None, max_frames=None, days_per_frame=None):
+		self.fps = fps
+		self.duration = duration
+		self.max_frames = max_frames
+		self.days_per_frame = days_per_frame
+
+	# frames and interval (ms) for span julian years, which is years of planet_y
+	def plan(self, span, years):
+		if self.days_per_frame is not None:
+			frames = span * JULIAN_YEAR / self.days_per_frame
+		elif self.duration is not None:
+			frames = self.duration * self.fps
+		else:
+			frames = years * self.fps
+		frames = max(int(frames), 1)
+		fps = self.fps
+		if self.max_frames is not None and frames > self.max_frames:
+			fps *= self.max_frames / frames
+			frames = self.max_frames
+		return frames, 1000 / fps
+
+
+# full renders left running by save_progressive, one at a time
+_refine = ThreadPoolExecutor(1)
+
+
+# saves a quick preview first, every step-th frame at low dpi with the fps
+# lowered to match so it lasts as long as the full animation, then finishes
+# the full render on a background thread; the figure is closed once it is done
+# returns the preview file and a future for the full file
+def save_progressive(
+	fig,
+	update,
+	frames,
+	fps,
+	fn,
+	workers=1,
+	job=None,
+	progress=None,
+	preview_frames=20,
+	dpi=40
+):
+	step = -(-frames // preview_frames)
+	root, ext = os.path.splitext(fn)
+	preview = f"{root}.preview{ext}"
+	full_dpi = fig.dpi
+	fig.set_dpi(dpi)
+	save_stream(
+		fig, lambda frame: update(frame * step), -(-frames // step), fps / step,
+		preview)
+	fig.set_dpi(full_dpi)
+
+	def refine():
+		try:
+			if workers > 1 and job is not None:
+				return save_parallel(job, frames, fps, fn, workers, progress=progress)
+			return save_stream(fig, update, frames, fps, fn, progress)
+		finally:
+			close_figure(fig)
+
+	return preview, _refine.submit(refine)
+
+
+# shows or saves an animation made by one of the animate methods
+# f_ext: "" shows it, "html" writes an html5 video, "figure" returns
+# (fig, update, frames) without animating, anything else is saved with ffmpeg
+# workers > 1 renders saved frames in parallel, rebuilding the figure from job
+# blit: when shown, caches the static background (orbits, star) once and
+# only redraws the artists update returns on each frame; off for 3d axes,
+# whose artists are only projected by a full draw
+# progress(done, total) is called as saved frames are written
+# preview: saves a quick preview and returns (preview file, future of the full
+# file) instead of waiting for the full render, see save_progressive
+def output(
+	fig,
+	update,
+	frames,
+	interval,
+	f_ext,
+	fname,
+	grid=True,
+	blit=True,
+	workers=1,
+	job=None,
+	progress=None,
+	preview=False
+):
+	if f_ext == "figure":
+		return fig, update, frames
+	if preview is True and f_ext not in ("", "html"):
+		return save_progressive(
+			fig, update, frames, 1000 / interval, f"{fname}.{f_ext}", workers, job,
+			progress)
+
+	fn = None
+	if f_ext == "":
+		blit = blit and not any(ax.name == "3d" for ax in fig.axes)
+		anim = FuncAnimation(
+			fig=fig, func=update, frames=frames, interval=interval, blit=blit)
+		if grid is True:
+			for ax in fig.axes:
+				ax.grid(True)
+		plt.show()
+	elif f_ext == "html":
+		save_html(fig, update, frames, 1000 / interval, f"{fname}.html", progress)
+	elif workers > 1 and job is not None:
+		fn = save_parallel(
+			job, frames, 1000 / interval, f"{fname}.{f_ext}", workers,
+			progress=progress)
+	else:
+		fn = save_stream(
+			fig, update, frames, 1000 / interval, f"{fname}.{f_ext}", progress)
+	close_figure(fig)
+	return fn
+
+
+# least recently used cache of computed arrays, bounded by entries and bytes
+# arrays are made read-only when stored and handed back without copying
+# a key of None always computes, for geometry that cannot be keyed
+class LRUCache:
+	def __init__(self, maxsize=256, maxbytes=64 << 20):
+		self.maxsize = maxsize
+		self.maxbytes = maxbytes
+		self.entries = OrderedDict()
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+
+	def get(self, key, compute):
+		if key is None:
+			return compute()
+		with self.lock:
+			value = self.entries.get(key)
+			if value is not None:
+				self.entries.move_to_end(key)
+				self.hits += 1
+				return value
+			self.misses += 1
+
+		value = compute()
+		value.flags.writeable = False
+		if value.nbytes > self.maxbytes:
+			return value
+		with self.lock:
+			if key not in self.entries:
+				self.entries[key] = value
+				self.nbytes += value.nbytes
+			while len(self.entries) > self.maxsize or self.nbytes > self.maxbytes:
+				self.nbytes -= self.entries.popitem(last=False)[1].nbytes
+		return value
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.nbytes = 0
+
+
+# orbit curves shared by every figure, see Planet.cache_key
+geometry_cache = LRUCache()
+
+RENDERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "renders")
+RENDER_VERSION = 2  # part of every render key, raised when renders change
+
+
+# content-addressed store of rendered files, named by a hash of what produced
+# them; file modification times order the entries, so a hit touches the file
+# and the least recently used files are deleted once maxbytes is exceeded
+class RenderCache:
+	def __init__(self, path=RENDERS, maxbytes=512 << 20):
+		self.path = path
+		self.maxbytes = maxbytes
+		self.lock = threading.Lock()
+
+	# hash of any reprs, e.g. the task, planets' cache keys, years and format
+	@staticmethod
+	def key(*parts):
+		return hashlib.sha256(repr((RENDER_VERSION,) + parts).encode()).hexdigest()
+
+	def file(self, key, f_ext):
+		return os.path.join(self.path, f"{key}.{f_ext}")
+
+	# path of the cached file or None
+	def get(self, key, f_ext):
+		fn = self.file(key, f_ext)
+		try:
+			os.utime(fn)
+		except FileNotFoundError:
+			return None
+		return fn
+
+	# cached file, otherwise render(fname) writes fname.f_ext, which is moved in
+	# under its key once complete, so a partial render is never served
+	def fetch(self, key, f_ext, render):
+		fn = self.get(key, f_ext)
+		if fn is not None:
+			return fn
+		os.makedirs(self.path, exist_ok=True)
+		part = os.path.join(self.path, f"{key}.{os.getpid()}.part")
+		fn = self.file(key, f_ext)
+		os.replace(render(part), fn)
+		self.evict(keep=fn)
+		return fn
+
+	# deletes least recently used files until the cache fits in maxbytes
+	def evict(self, keep=None):
+		with self.lock:
+			entries = []
+			for entry in os.scandir(self.path):
+				if entry.is_file() and ".part." not in entry.name:
+					stat = entry.stat()
+					entries.append((stat.st_mtime, stat.st_size, entry.path))
+			total = sum(size for _, size, _ in entries)
+			for _, size, fn in sorted(entries):
+				if total <= self.maxbytes:
+					break
+				if fn != keep:
+					try:
+						os.remove(fn)
+					except FileNotFoundError:
+						pass  # evicted by another process
+					total -= size
+
+
+render_cache = RenderCache()
+
+
 class Star:
-	def __init__(self, name, marker, color, size):
+	def __init__(self, name, marker, color, size, mass=1):
 		self.name = name
 		self.marker = marker
 		self.color = color
 		self.size = size
+		self.mass = mass  # in solar masses
 
 
 class Planet:
@@ -78,7 +928,10 @@ class Planet:
 		period=1,  # in sidereal/julian years
 		eccentricity=0,  # should be less than 1
 		inclination=0,  # in degrees (convert to radians in calculations)
-		true_anomaly=0  # in degrees (convert to radians in calculations)
+		true_anomaly=0,  # in degrees (convert to radians in calculations)
+		node=0,  # longitude of ascending node, in degrees
+		perihelion=0,  # argument of perihelion, in degrees
+		mass=0  # in solar masses, only felt by the n-body engine
 	):
 		self.name = name
 		self.sm_axis = sm_axis
@@ -86,34 +939,101 @@ class Planet:
 		self.eccentricity = eccentricity
 		self.inclination = inclination
 		self.true_anomaly = true_anomaly
-
-	# plots line graph of elliptical orbit
-	def plot_orbit(self, label=False):
-		theta = np.linspace(0, 2 * np.pi, 1000)
-		a = self.sm_axis
-		e = self.eccentricity
-		r = a * (1 - e ** 2) / (1 + e * np.cos(theta))
-		x = r * np.cos(theta)
-		y = r * np.sin(theta)
+		self.node = node
+		self.perihelion = perihelion
+		self.mass = mass
+
+	# perifocal to ecliptic rotation matrix, cached on the planet
+	# rebuilt only when one of its angles has been changed
+	def rotation(self):
+		key = (self.node, self.inclination, self.perihelion)
+		if getattr(self, "_rotation_key", None) != key:
+			self._rotation = rotation_matrix(*key)
+			self._rotation_key = key
+		return self._rotation
+
+	# mean anomaly at time 0 in radians, from the true anomaly at epoch
+	# cached on the planet like the rotation matrix
+	def phase(self):
+		key = (self.true_anomaly, self.eccentricity)
+		if getattr(self, "_phase_key", None) != key:
+			self._phase = float(mean_anomaly(*key))
+			self._phase_key = key
+		return self._phase
+
+	# identifies the planet's geometry in geometry_cache, followed by args
+	def cache_key(self, *args):
+		return (
+			self.sm_axis, self.eccentricity, self.inclination, self.period,
+			self.true_anomaly, self.node, self.perihelion) + args
+
+	# furthest distance from the star, in AU
+	def aphelion(self):
+		return self.sm_axis * (1 + self.eccentricity)
+
+	# plots line graph of elliptical orbit on ax, the current pyplot axes if None
+	# tol: largest deviation from the true ellipse in AU, defaults to half a pixel
+	def plot_orbit(self, label=False, tol=None, ax=None):
+		if ax is None:
+			ax = plt.gca()
+		if tol is None:
+			tol = pixel_tolerance(ax, 2 * self.aphelion())
+		x, y, _ = self.orbit_path(tol).T
 		if label is True:
-			plt.plot(x, y, label=self.name)
+			ax.plot(x, y, label=self.name)
 		else:
-			plt.plot(x, y)
+			ax.plot(x, y)
 
 	# plots 3d line graph of elliptical orbit
 	# ax must be 3d
-	def plot_orbit_3d(self, fig, ax, label=False):
-		theta = np.linspace(0, 2 * np.pi, 1000)
-		a = self.sm_axis
-		e = self.eccentricity
-		r = a * (1 - e ** 2) / (1 + e * np.cos(theta))
-		x = r * np.cos(theta) * np.cos(np.deg2rad(self.inclination))
-		y = r * np.sin(theta)
-		z = r * np.cos(theta) * np.sin(np.deg2rad(self.inclination))
+	def plot_orbit_3d(self, fig, ax, label=False, tol=None):
+		if tol is None:
+			tol = pixel_tolerance(ax, 2 * self.aphelion())
+		x, y, z = self.orbit_path(tol, three_d=True).T
 		if label is True:
-			plt.plot(x, y, z, label=self.name)
+			ax.plot(x, y, z, label=self.name)
 		else:
-			plt.plot(x, y, z)
+			ax.plot(x, y, z)
+
+	# closed orbit within tol AU as a read-only (samples, 3) table
+	# in the ecliptic frame, projected onto z = 0 unless three_d, like trajectory
+	def orbit_path(self, tol, three_d=False):
+		def path():
+			theta, r = ellipse_samples(self.sm_axis, self.eccentricity, tol)
+			return ecliptic(theta, r, self.rotation(), three_d)
+
+		return geometry_cache.get(self.cache_key("orbit", tol, three_d), path)
+
+	# path over yrs relative to centre (the star when None), shape (times, 3)
+	# sp samples evenly in time, otherwise samples are placed adaptively so the
+	# drawn path stays within tol AU of the true one (half a pixel by default)
+	# returned read-only, as it may be shared through geometry_cache
+	def ptol_path(self, ax, yrs, sp=None, centre=None, tol=None, three_d=False):
+		def path(time):
+			pos = self.trajectory(time, three_d)
+			if centre is not None:
+				pos -= centre.trajectory(time, three_d)
+			return pos
+
+		extent = 2 * self.aphelion()
+		period = self.period
+		if centre is not None:
+			extent += 2 * centre.aphelion()
+			period = min(period, centre.period)
+		if sp is None and tol is None:
+			tol = pixel_tolerance(ax, extent)
+		n = max(16, int(np.ceil(8 * yrs / period)))  # resolve every revolution
+
+		def compute():
+			if sp is not None:
+				return path(np.linspace(0, yrs, sp))
+			return adaptive_samples(path, 0, yrs, tol, n)[1]
+
+		key = self.cache_key("ptol", yrs, sp, tol, three_d)
+		if key is not None and centre is not None:
+			centre_key = centre.cache_key()
+			key = None if centre_key is None else key + centre_key
+		return geometry_cache.get(key, compute)
 
 	# plots line graph of elliptical orbit
 	def ptol_orbit(
@@ -122,17 +1042,16 @@ class Planet:
 		offset=(0, 0),
 		rt=False,
 		yrs=1,
-		sp=1000,
+		sp=None,
 		label=False,
 		lw=1,
-		marker=None
+		marker=None,
+		centre=None,
+		tol=None
 	):
-		a = self.sm_axis
-		e = self.eccentricity
-		time = np.linspace(0, yrs, sp)
-		theta, r = kepler_eq(time, a, self.period, e)
-		x = r * np.cos(theta) - offset[0]
-		y = r * np.sin(theta) - offset[1]
+		pos = self.ptol_path(ax, yrs, sp, centre, tol)
+		x = pos[:, 0] - offset[0]
+		y = pos[:, 1] - offset[1]
 		if rt is True:
 			return (x, y)
 		else:
@@ -147,18 +1066,17 @@ class Planet:
 		offset=(0, 0, 0),
 		rt=False,
 		yrs=1,
-		sp=1000,
+		sp=None,
 		label=False,
 		lw=1,
-		marker=None
+		marker=None,
+		centre=None,
+		tol=None
 	):
-		a = self.sm_axis
-		e = self.eccentricity
-		time = np.linspace(0, yrs, sp)
-		theta, r = kepler_eq(time, a, self.period, e)
-		x = r * np.cos(theta) * np.cos(np.deg2rad(self.inclination)) - offset[0]
-		y = r * np.sin(theta) - offset[1]
-		z = r * np.cos(theta) * np.sin(np.deg2rad(self.inclination)) - offset[2]
+		x, y, z = self.ptol_path(ax, yrs, sp, centre, tol, three_d=True).T
+		x = x - offset[0]
+		y = y - offset[1]
+		z = z - offset[2]
 		if rt is True:
 			return (x, y, z)
 		else:
@@ -167,22 +1085,28 @@ class Planet:
 			else:
 				ax.plot(x, y, z, lw=lw, marker=marker)
 
+	# position at every time in one vectorized solve, shape (times, 3)
+	# in the ecliptic frame, projected onto z = 0 unless three_d
+	def trajectory(self, time, three_d=False):
+		theta, r = kepler_batch(
+			np.asarray(time), self.sm_axis, self.period, self.eccentricity,
+			self.phase())
+		return ecliptic(theta, r, self.rotation(), three_d)
+
 	# animates scatter point according to kepler's laws
-	def animate_orbit(self, f_ext=""):
+	def animate_orbit(self, f_ext="", workers=1, progress=None, budget=None, fname=""):
 		years = 5
-		i = 20
-		frames = int((1000 / i) * years)
+		frames, i = (budget or RenderBudget()).plan(self.period * years, years)
 		a = self.sm_axis
 		e = self.eccentricity
 		time = np.linspace(0, self.period * years, frames + 1)
+		pos = self.trajectory(time)
 
-		theta, r = kepler_eq(time[0], a, self.period, e)
-
-		x = r * np.cos(theta)
-		y = r * np.sin(theta)
-		fig, ax = plt.subplots()
+		x, y = pos[0, :2]
+		fig = new_figure(f_ext)
+		ax = fig.add_subplot()
 		ax.scatter(0, 0, s=100, c="#FFE100", marker="x", label="Star")
-		self.plot_orbit()
+		self.plot_orbit(ax=ax)
 		p = ax.scatter(x, y, c="b", s=20, label=self.name)
 		ax.set(
 			aspect="equal",
@@ -193,47 +1117,32 @@ class Planet:
 			facecolor="#333333")
 		ax.legend(loc="upper right")
 
-		def update(frame):
-			ax.set(title=f"{self.name}: t={time[frame]:.3f} Julian years")
+		ax.set_title(self.name)
+		label = time_label(ax, "#333333")
 
-			theta, r = kepler_eq(time[frame], a, self.period, e)
+		def update(frame):
+			label.set_text(f"t={time[frame]:.3f} Julian years")
+			p.set_offsets(pos[frame, :2])
+			return p, label
 
-			x = r * np.cos(theta)
-			y = r * np.sin(theta)
-			data = np.stack([x, y]).T
-			p.set_offsets(data)
-			return p
+		if fname == "":
+			fname = f"../images/Task 3/{self.name} Orbit"
 
-		anim = FuncAnimation(fig=fig, func=update, frames=frames, interval=i)
-		if f_ext == "":
-			plt.grid(True)
-			plt.show()
-		elif f_ext == "html":
-			with open(
-				f"../images/Task 3/{self.name} Orbit.html",
-				"w"
-			) as f:
-				print(anim.to_html5_video(), file=f)
-		else:
-			anim.save(
-				f"../images/Task 3/{self.name} Orbit.{f_ext}",
-				writer="ffmpeg")
-		plt.close()
+		return output(
+			fig, update, frames, i, f_ext, fname, workers=workers,
+			progress=progress,
+			job=(self, "animate_orbit", (), {"budget": budget}))
 
-	def animate_3d(self, f_ext=""):
+	def animate_3d(self, f_ext="", workers=1, progress=None, budget=None, fname=""):
 		years = 5
-		i = 20
-		frames = int((1000 / i) * years)
+		frames, i = (budget or RenderBudget()).plan(self.period * years, years)
 		a = self.sm_axis
 		e = self.eccentricity
 		time = np.linspace(0, self.period * years, frames + 1)
+		pos = self.trajectory(time, three_d=True)
 
-		theta, r = kepler_eq(time[0], a, self.period, e)
-
-		x = r * np.cos(theta) * np.cos(np.deg2rad(self.inclination))
-		y = r * np.sin(theta)
-		z = r * np.cos(theta) * np.sin(np.deg2rad(self.inclination))
-		fig = plt.figure()
+		x, y, z = pos[0]
+		fig = new_figure(f_ext)
 		ax = fig.add_subplot(111, projection="3d")
 		ax.scatter(0, 0, 0, s=100, c="#FFE100", marker="x", label="Star")
 		p = ax.plot(x, y, z, c="b", marker="o", label=self.name)[0]
@@ -248,44 +1157,432 @@ class Planet:
 			facecolor="#333333")
 		ax.legend(loc="upper right")
 
-		def update(frame):
-			ax.set(title=f"{self.name}: t={time[frame]:.3f} Julian years")
-
-			theta, r = kepler_eq(time[frame], a, self.period, e)
+		ax.set_title(self.name)
+		label = time_label(ax, "#333333")
 
-			x = r * np.cos(theta) * np.cos(np.deg2rad(self.inclination))
-			y = r * np.sin(theta)
-			z = r * np.cos(theta) * np.sin(np.deg2rad(self.inclination))
-			data = np.stack([x, y]).T
-			p.set_data(data)
-			p.set_3d_properties(z)
-			return p
+		def update(frame):
+			label.set_text(f"t={time[frame]:.3f} Julian years")
+			p.set_data(pos[frame, :2, None])
+			p.set_3d_properties(pos[frame, 2:])
+			return p, label
 
-		anim = FuncAnimation(fig=fig, func=update, frames=frames, interval=i)
-		if f_ext == "":
-			plt.grid(True)
-			plt.show()
-		elif f_ext == "html":
-			with open(
-				f"../images/Task 4/{self.name} Orbit 3D.html",
-				"w"
-			) as f:
-				print(anim.to_html5_video(), file=f)
-		else:
-			anim.save(
-				f"../images/Task 4/{self.name} Orbit 3D.{f_ext}",
-				writer="ffmpeg")
-		plt.close()
+		if fname == "":
+			fname = f"../images/Task 4/{self.name} Orbit 3D"
+
+		return output(
+			fig, update, frames, i, f_ext, fname, workers=workers,
+			progress=progress,
+			job=(self, "animate_3d", (), {"budget": budget}))
+
+
+# planet whose orbital elements vary with time, interpolated between the
+# epochs of a table of osculating elements instead of one frozen set
+# table is a structured array as from load_horizons, loaded from the data
+# folder for the planet's name if None
+# time 0 is the julian day epoch (the preset planets' epoch by default, so it
+# can share a PlanetarySystem with them) and times are in julian years as for
+# Planet
+class OsculatingPlanet(Planet):
+	def __init__(self, name, table=None, epoch=None):
+		if table is None:
+			table = load_horizons(horizons_file(name))
+		self.jd = np.array(table["JD"])
+		self.epoch = PRESET_EPOCH if epoch is None else epoch
+		self.n = np.array(table["N"])  # mean motion, deg/day
+
+		# the mean anomaly may advance by more than 180 degrees between rows, so
+		# whole revolutions are counted from the mean motion rather than unwrapped
+		# from consecutive differences
+		ma = np.array(table["MA"])
+		ahead = ma[0] + np.concatenate(
+			[[0], np.cumsum(np.diff(self.jd) * (self.n[1:] + self.n[:-1]) / 2)])
+		M = ma + 360 * np.round((ahead - ma) / 360)
+
+		# interpolation tables, built once and shared by every query
+		# angles are unwrapped so interpolating across 360 -> 0 goes forwards
+		self.table = {
+			"a": np.array(table["A"]),
+			"e": np.array(table["EC"]),
+			"i": np.array(table["IN"]),
+			"node": np.unwrap(table["OM"], period=360),
+			"peri": np.unwrap(table["W"], period=360),
+			"M": M,
+			"period": np.array(table["PR"]) / JULIAN_YEAR
+		}
+
+		a, e, i, node, peri, M = self.elements_at(0)
+		E = solve_kepler(np.deg2rad(M), e)
+		theta = 2 * np.arctan2(
+			np.sqrt(1 + e) * np.sin(E / 2), np.sqrt(1 - e) * np.cos(E / 2))
+		super().__init__(
+			name=name,
+			sm_axis=float(a),
+			period=float(self.interp(0, "period")),
+			eccentricity=float(e),
+			inclination=float(i),
+			true_anomaly=float(np.rad2deg(theta) % 360),
+			node=float(node % 360),
+			perihelion=float(peri % 360))
+
+	def interp(self, time, key):
+		jd = self.epoch + np.asarray(time) * JULIAN_YEAR
+		return np.interp(jd, self.jd, self.table[key])
+
+	# time-varying elements are not captured by a key, so never cached
+	def cache_key(self, *args):
+		return None
+
+	# a, e, i, longitude of ascending node, argument of perihelion and mean
+	# anomaly at the given times (julian years since epoch), angles in degrees
+	# outside the table the elements are held at the end values, except the
+	# mean anomaly, which keeps advancing at the end mean motion
+	def elements_at(self, time):
+		jd = self.epoch + np.asarray(time) * JULIAN_YEAR
+		a, e, i, node, peri, M = [
+			np.interp(jd, self.jd, self.table[key])
+			for key in ["a", "e", "i", "node", "peri", "M"]]
+		M = M + np.minimum(jd - self.jd[0], 0) * self.n[0]
+		M = M + np.maximum(jd - self.jd[-1], 0) * self.n[-1]
+		return a, e, i, node, peri, M
+
+	# the orbit's orientation follows the interpolated angles, so every time
+	# gets its own rotation matrix
+	def trajectory(self, time, three_d=False):
+		a, e, i, node, peri, M = self.elements_at(time)
+		E = solve_kepler(np.deg2rad(M), e)
+		theta = 2 * np.arctan2(
+			np.sqrt(1 + e) * np.sin(E / 2), np.sqrt(1 - e) * np.cos(E / 2))
+		r = a * (1 - e * np.cos(E))
+		table = positions(theta, r)
+		table = np.matmul(rotation_matrix(node, i, peri), table[..., None])[..., 0]
+		if three_d is not True:
+			table[..., 2] = 0
+		return table
+
+
+# planet-centric frame transform, computed once per render
+# caches the centre planet's trajectory over a time grid so that every frame
+# and every planet subtracts the same offset instead of re-solving it
+class RelativeEphemeris:
+	def __init__(self, planet_c, time, three_d=False):
+		self.planet = planet_c
+		self.time = np.asarray(time)
+		self.three_d = three_d
+		self.offset = planet_c.trajectory(self.time, three_d=three_d)  # (times, 3)
+
+	# shifts a (..., times, 3) trajectory table into the centre planet's frame
+	def transform(self, table):
+		return table - self.offset
+
+	# trajectory of a single planet relative to the centre planet
+	def relative(self, planet):
+		return self.transform(planet.trajectory(self.time, three_d=self.three_d))
+
+
+# n-body propagation of a planetary system with a kick-drift-kick leapfrog
+# the star and planets move under their mutual gravity in the barycentric
+# frame, starting from each planet's elements at time 0, and are returned as
+# heliocentric (planets, times, 3) tables like the kepler ones
+# accelerations come from the pairwise separations, taken in blocks of rows
+# for large systems, and every state lives in arrays allocated once
+# bodies move in the ecliptic frame, and 2d tables are projected onto it
+# the star's gm is fitted to the planets' own periods, the median of
+# 4 pi^2 a^3 / P^2 - G m over them, rather than taken from its mass: preset
+# periods imply a gm ~0.14% below G M, which would otherwise drift the engines
+# apart by ~0.05 AU over 10 years; one gm for the star keeps the forces
+# pairwise equal and opposite, so momentum is conserved
+# leapfrog's phase error grows as (dt / P)^2: at the default dt an a = 1 AU
+# orbit drifts from the kepler one by ~8e-5 AU per year (~8e-7 at dt=1e-4)
+# and mercury's by ~1.5e-3 AU per year
+class NBody:
+	def __init__(self, system, three_d=False, dt=1e-3, block=None):
+		star_mass = 1 if system.star is None else system.star.mass
+		self.mass = np.array([star_mass] + [planet.mass for planet in system.planets])
+		n = self.mass.size
+		self.gm = G * self.mass
+		a, period, e, m = (x[:, 0] for x in system.elements())
+		self.gm[0] = np.median(4 * np.pi ** 2 * a ** 3 / period ** 2 - self.gm[1:])
+		self.dt = dt  # largest step, in years
+		self.time = 0.0
+		self.block = min(n, block or max(1, (1 << 18) // n))  # rows per block
+
+		self.three_d = three_d
+
+		rotation = np.array([planet.rotation() for planet in system.planets])
+		self.pos = np.zeros((n, 3))
+		self.vel = np.zeros((n, 3))
+		self.pos[1:], self.vel[1:] = state_vectors(
+			a, e, m, self.gm[0] + self.gm[1:], rotation)
+		# barycentric frame, weighted by gm as the forces are
+		self.pos -= self.gm @ self.pos / self.gm.sum()
+		self.vel -= self.gm @ self.vel / self.gm.sum()
+
+		self.acc = np.empty((n, 3))
+		self.kick = np.empty((n, 3))
+		self.cols = np.empty((3, n))  # positions as contiguous x, y, z rows
+		self.dx = np.empty((self.block, n))
+		self.r3 = np.empty((self.block, n))
+		self.r = np.empty((self.block, n))
+		self.accelerations()
+
+	# acceleration of every body due to all the others, into self.acc
+	# sum_j w_ij (p_j - p_i) is taken as w @ p - p_i sum_j w_ij, so the (n, n, 3)
+	# difference table is never formed and the sum is a single matrix product
+	def accelerations(self):
+		n = self.mass.size
+		self.cols[:] = self.pos.T
+		for start in range(0, n, self.block):
+			stop = min(start + self.block, n)
+			k = stop - start
+			dx, r3, r = self.dx[:k], self.r3[:k], self.r[:k]
+			r3.fill(0)
+			for x in self.cols:
+				np.subtract(x[None, :], x[start:stop, None], out=dx)
+				np.multiply(dx, dx, out=dx)
+				r3 += dx
+			r3[np.arange(k), np.arange(start, stop)] = np.inf  # no self attraction
+			np.sqrt(r3, out=r)
+			r3 *= r
+			np.divide(self.gm, r3, out=r3)
+			acc = self.acc[start:stop]
+			np.matmul(r3, self.pos, out=acc)
+			acc -= self.pos[start:stop] * r3.sum(axis=1)[:, None]
+		return self.acc
+
+	# advances the system by a number of leapfrog steps of dt years
+	def step(self, steps, dt):
+		for _ in range(steps):
+			np.multiply(self.acc, 0.5 * dt, out=self.kick)
+			self.vel += self.kick
+			np.multiply(self.vel, dt, out=self.kick)
+			self.pos += self.kick
+			self.accelerations()
+			np.multiply(self.acc, 0.5 * dt, out=self.kick)
+			self.vel += self.kick
+		self.time += steps * dt
+
+	# heliocentric planet positions at increasing times, (planets, times, 3)
+	# each interval between times is split into equal steps of at most dt
+	# projected onto the ecliptic (z = 0) unless three_d
+	def trajectories(self, time, out=None):
+		time = np.asarray(time, dtype=np.float64)
+		if out is None:
+			out = np.empty((self.mass.size - 1, time.size, 3))
+		for c, t in enumerate(time):
+			if t < self.time:
+				raise ValueError("times must increase from the current time")
+			if t > self.time:
+				steps = max(int(np.ceil((t - self.time) / self.dt - 1e-9)), 1)
+				self.step(steps, (t - self.time) / steps)
+			np.subtract(self.pos[1:], self.pos[0], out=out[:, c])
+		if self.three_d is not True:
+			out[..., 2] = 0
+		return out
+
+
+# spirograph lines between every unique pair of planets, held in collections
+# of chunk frames each; segments for all frames are precomputed once from a
+# (planets, frames, 3) trajectory table, and an update only resets the
+# collections whose shown frames changed, normally just the current one, so
+# its cost does not grow with the frame number
+class SpirographLines:
+	def __init__(self, ax, pos, three_d=False, chunk=128, **kwargs):
+		dims = 3 if three_d is True else 2
+		self.segments = pair_segments(pos, dims)  # (frames, pairs, 2, dims)
+		self.chunk = chunk
+		self.lines = []
+		for _ in range(0, len(self.segments), chunk):
+			if three_d is True:
+				lines = Line3DCollection([], **kwargs)
+				ax.add_collection3d(lines, autolim=False)
+			else:
+				lines = LineCollection([], **kwargs)
+				ax.add_collection(lines, autolim=False)
+			self.lines.append(lines)
+		self.shown = [0] * len(self.lines)  # frames shown by each collection
+
+	# shows the lines of all frames up to and including frame
+	def update(self, frame):
+		dims = self.segments.shape[-1]
+		for c, lines in enumerate(self.lines):
+			start = c * self.chunk
+			shown = min(max(frame + 1 - start, 0), self.chunk)
+			if shown != self.shown[c]:
+				lines.set_segments(
+					self.segments[start:start + shown].reshape(-1, 2, dims))
+				self.shown[c] = shown
+		return self.lines
+
+
+# population of massless bodies, e.g. an asteroid belt, stored as arrays
+# every element is one contiguous array over the bodies instead of a Planet
+# each, so a frame is a single batched kepler solve over all of them
+# angles in degrees as for Planet; period defaults to kepler's third law for a
+# star of one solar mass; float32 halves memory and doubles solving speed
+# 2d shows the orbits projected onto the ecliptic, as for planets
+class Population:
+	def __init__(
+		self,
+		name,
+		sm_axis,
+		eccentricity,
+		inclination=0,
+		node=0,
+		perihelion=0,
+		mean_anomaly=0,
+		period=None,
+		color="#999999",
+		size=1,
+		alpha=0.3,
+		dtype=np.float32
+	):
+		a = np.asarray(sm_axis, dtype=np.float64)
+		n = a.size
+		self.name = name
+		self.color = color
+		self.size = size
+		self.alpha = alpha
+		self.dtype = dtype
+		self.sm_axis = a.astype(dtype)
+		self.eccentricity = np.broadcast_to(eccentricity, n).astype(dtype)
+		if period is None:
+			period = a ** 1.5
+		self.period = np.array(np.broadcast_to(period, n), dtype=np.float64)
+		self.motion = 2 * np.pi / self.period  # mean motion, radians per year
+		self.phase = np.deg2rad(np.broadcast_to(mean_anomaly, n), dtype=np.float64)
+		self.minor = self.sm_axis * np.sqrt(1 - self.eccentricity ** 2)
+
+		# first two columns of each orbit's rotation, as contiguous x, y, z rows
+		# positions are then (a(cos E - e)) p + (b sin E) q
+		i, o, w = (np.broadcast_to(x, n) for x in (inclination, node, perihelion))
+		rotation = rotation_matrix(o, i, w)
+		self.p = np.ascontiguousarray(rotation[:, :, 0].T, dtype=dtype)
+		self.q = np.ascontiguousarray(rotation[:, :, 1].T, dtype=dtype)
+
+		# work arrays, reused by every frame
+		self.M = np.empty(n)
+		self.E = np.empty(n, dtype=dtype)
+		self.x = np.empty(n, dtype=dtype)
+		self.y = np.empty(n, dtype=dtype)
+		self.tmp = np.empty(n, dtype=dtype)
+
+	def __len__(self):
+		return self.sm_axis.size
+
+	# largest distance from the star, for axis limits
+	def aphelion(self):
+		return float(np.max(self.sm_axis * (1 + self.eccentricity)))
+
+	# positions of all bodies at a single time in years, (bodies, 3) or
+	# (bodies, 2) without three_d, written into out when given
+	def positions_at(self, time, three_d=False, out=None):
+		dims = 3 if three_d is True else 2
+		if out is None:
+			out = np.empty((len(self), dims), dtype=self.dtype)
+		np.multiply(self.motion, time, out=self.M)
+		self.M += self.phase
+		E = solve_kepler(self.M, self.eccentricity, out=self.E, dtype=self.dtype)
+		np.cos(E, out=self.x)
+		self.x -= self.eccentricity
+		self.x *= self.sm_axis
+		np.sin(E, out=self.y)
+		self.y *= self.minor
+		for d in range(dims):
+			np.multiply(self.x, self.p[d], out=self.tmp)
+			np.multiply(self.y, self.q[d], out=out[:, d])
+			out[:, d] += self.tmp
+		return out
+
+	# a single scatter artist for all bodies at time 0, updated by update()
+	# square markers of size 1, the cheapest that agg still draws (smaller are dropped)
+	def scatter(self, ax, three_d=False):
+		pos = self.positions_at(0, three_d)
+		kwargs = dict(
+			s=self.size, c=self.color, alpha=self.alpha, marker="s", linewidths=0,
+			label=self.name, zorder=0.5)  # below the planets and their orbits
+		if three_d is True:
+			return ax.scatter(*pos.T, depthshade=False, **kwargs)
+		return ax.scatter(*pos.T, **kwargs)
+
+	# moves the artist from scatter() to the given time
+	def update(self, artist, time, three_d=False):
+		pos = self.positions_at(time, three_d)
+		artist.set_offsets(pos[:, :2])
+		if three_d is True:
+			artist.set_3d_properties(pos[:, 2], "z")
+		return artist
 
 
 class PlanetarySystem:
-	def __init__(self, name, star, planets):
+	def __init__(self, name, star, planets, engine="kepler", populations=()):
 		self.name = name
 		self.star = star
 		self.planets = sort_p([*set(planets)])
+		self.engine = engine  # "kepler" (two-body orbits) or "nbody", see NBody
+		self.populations = list(populations)  # Population objects, e.g. main_belt()
+
+	# orbital elements of all planets as (planets, 1) columns for batched solving
+	def elements(self):
+		a = np.array([planet.sm_axis for planet in self.planets])[:, None]
+		period = np.array([planet.period for planet in self.planets])[:, None]
+		e = np.array([planet.eccentricity for planet in self.planets])[:, None]
+		m = np.array([planet.phase() for planet in self.planets])[:, None]
+		return a, period, e, m
+
+	# true anomaly and distance of every planet at every time in one call
+	# returns (planets, times) arrays, keyword arguments go to kepler_batch
+	def kepler(self, time, **kwargs):
+		return kepler_batch(np.asarray(time), *self.elements(), **kwargs)
+
+	# trajectory table: position of every planet at every time in one pass
+	# returns a (planets, times, 3) array for animation updates to index into
+	# in the ecliptic frame, projected onto z = 0 unless three_d
+	# planets with time-varying elements are filled in from their own trajectory
+	# with the nbody engine the table is integrated instead, kwargs go to NBody
+	def trajectories(self, time, three_d=False, **kwargs):
+		if self.engine == "nbody":
+			return NBody(self, three_d, **kwargs).trajectories(time)
+		theta, r = self.kepler(time, **kwargs)
+		rotation = np.array([planet.rotation() for planet in self.planets])
+		table = ecliptic(theta, r, rotation, three_d)
+		for c, planet in enumerate(self.planets):
+			if isinstance(planet, OsculatingPlanet):
+				table[c] = planet.trajectory(time, three_d)
+		return table
+
+	# trajectory table relative to planet_c, shape (planets, times, 3)
+	# uses planet_c's own row when it is in the system, so the centre moves
+	# exactly as it does in the table, whichever engine produced it
+	def relative(self, planet_c, time, three_d=False):
+		table = self.trajectories(time, three_d)
+		if planet_c in self.planets:
+			return table - table[self.planets.index(planet_c)]
+		return RelativeEphemeris(planet_c, time, three_d).transform(table)
+
+	# one scatter artist per population, widening the axes to show them all
+	def scatter_populations(self, ax, three_d=False):
+		belts = []
+		for population in self.populations:
+			belts.append(population.scatter(ax, three_d))
+			lim = population.aphelion() * 1.2
+			if lim > ax.get_xlim()[1]:
+				ax.set(xlim=[-lim, lim], ylim=[-lim, lim])
+				if three_d is True:
+					ax.set(zlim=[-lim, lim])
+		if belts:
+			ax.legend(loc="upper right")
+		return belts
 
 	# plot log graph of semi-major axis vs orbital period
-	def task1(self, fc="#333333", f_ext="", fname=""):
+	def task1(
+		self,
+		fc="#333333",
+		f_ext="",
+		fname="",
+		workers=1,
+		progress=None,
+		preview=False
+	):
 		x = np.array([planet.sm_axis for planet in self.planets])
 		y = np.array([planet.period for planet in self.planets])
 
@@ -296,10 +1593,11 @@ class PlanetarySystem:
 		k_array = np.array([x2[i] / y2[i] for i in range(len(x2))])
 		k = sum(k_array) / len(k_array)  # average k
 
-		fig, ax = plt.subplots(figsize=(7, 7))
+		fig = new_figure(f_ext, figsize=(7, 7))
+		ax = fig.add_subplot()
 
 		def update(frame):
-			plt.cla()
+			ax.cla()
 			if frame % 2 == 0:
 				ax.set(
 					title="""Kepler's Third Law (log-log)
@@ -314,7 +1612,7 @@ k ≈ 1.5""",
 				ax.loglog(x, y, marker="*", mec="b", mfc="b", c="k")
 				for c, planet in enumerate(self.planets):
 					ax.annotate(planet.name, (x[c], y[c]), color="g")
-				plt.grid(True, which="both")
+				ax.grid(True, which="both")
 			else:
 				ax.set(
 					title=f"Kepler's Third Law (AU^(3/2) vs yr)\nk = a^(3/2) / T\n≈ {k}",
@@ -329,73 +1627,78 @@ k ≈ 1.5""",
 				ax.plot(x2, a * x2 + b, c="k")
 				for c, planet in enumerate(self.planets):
 					ax.annotate(planet.name, (x2[c], y2[c]), color="g")
-				plt.grid(True)
+				ax.grid(True)
 
 			return ax
 
-		anim = FuncAnimation(fig=fig, func=update, frames=2, interval=2000)
 		if fname == "":
 			fname = f"../images/Task 1/{self.name}"
 
-		if f_ext == "":
-			plt.show()
-		elif f_ext == "html":
-			with open(f"{fname}.html", "w") as f:
-				print(anim.to_html5_video(), file=f)
-		else:
-			fn = f"{fname}.{f_ext}"
-			anim.save(fn, writer="ffmpeg")
-			plt.close()
-			return fn
-		plt.close()
+		return output(
+			fig, update, 2, 2000, f_ext, fname, grid=False, blit=False,
+			workers=workers,
+			progress=progress,
+			preview=preview,
+			job=(self, "task1", (fc,), {}))
 
-	def task5(self, planet_y, yrs, fc="#333333", f_ext="", fname=""):
+	# polar angle against time for every planet, circular and at its eccentricity
+	# all curves come from one (2 * planets, samples) batch of kepler_time
+	def task5(
+		self,
+		planet_y,
+		yrs,
+		fc="#333333",
+		f_ext="",
+		fname="",
+		workers=1,
+		samples=1001,
+		exact=True,
+		progress=None,
+		preview=False
+	):
 		years = planet_y.period * yrs
-		d = int(np.ceil(years))
-		fig, ax = plt.subplots()
+		period = np.repeat([planet.period for planet in self.planets], 2)
+		e = np.array([[0, planet.eccentricity] for planet in self.planets])
+		e = e.reshape(-1, 1)
+		theta = revolutions(years, period, samples)
+		time = kepler_time(theta, period[:, None], e, exact)
+
+		fig = new_figure(f_ext)
+		ax = fig.add_subplot()
 		ax.set(
 			title=self.name,
 			xlabel="Time / Julian years",
 			ylabel="Polar angle / radians",
+			xlim=[0, years],
+			ylim=[0, theta[time <= years].max()],
 			facecolor=fc
 		)
+		plots = []
+		for c, planet in enumerate(self.planets):
+			for k in range(2):
+				label = f"{planet.name} Ecc={e[2 * c + k, 0]:.2f}"
+				plots += ax.plot(time[2 * c + k], theta[2 * c + k], label=label)
+		ax.legend(loc="upper right")
 
 		def update(frame):
-			plots = []
-			for planet in self.planets:
-				for e in [0, planet.eccentricity]:
-					period = planet.period
-					time = np.linspace(0, years, d)
-					n = np.ceil(time[-1] / period)
-					theta = np.linspace(0, 2 * np.pi * n, d)
-					f = (1 - e * np.cos(theta)) ** -2
-					c = [1] + [4 if x % 2 == 0 else 2 for x in range(len(theta) - 2)] + [1]
-					t = period * (1 - e ** 2) ** (3 / 2) / (6 * np.pi) / d * np.cumsum(c * f)
-					label = f"{planet.name} Ecc={e:.2f}"
-					plots.append(ax.plot(np.interp(t, theta, time), label=label))
-			plt.legend(loc="upper right")
 			return plots
 
-		anim = FuncAnimation(fig=fig, func=update, frames=1, interval=1000)
-
 		if fname == "":
 			fname = f"../images/Task 5/{self.name}"
 
-		if f_ext == "":
-			plt.show()
-		elif f_ext == "html":
-			with open(f"{fname}.html", "w") as f:
-				print(anim.to_html5_video(), file=f)
-		else:
-			fn = f"{fname}.{f_ext}"
-			anim.save(fn, writer="ffmpeg")
-			plt.close()
-			return fn
-		plt.close()
+		return output(
+			fig, update, 1, 1000, f_ext, fname, grid=False, blit=False,
+			workers=workers,
+			progress=progress,
+			preview=preview,
+			job=(
+				self, "task5", (planet_y, yrs, fc),
+				{"samples": samples, "exact": exact}))
 
 	# plots line graphs of all planets in the system on one axis
-	def plot_orbits(self, fc="#333333", f_ext="", fname=""):
-		fig, ax = plt.subplots()
+	def plot_orbits(self, fc="#333333", f_ext="", fname="", progress=None):
+		fig = new_figure(f_ext)
+		ax = fig.add_subplot()
 		if self.star is not None:
 			ax.scatter(
 				0,
@@ -405,52 +1708,51 @@ k ≈ 1.5""",
 				marker=self.star.marker,
 				label=self.star.name)
 		for planet in self.planets:
-			planet.plot_orbit(label=True)
+			planet.plot_orbit(label=True, ax=ax)
 		ax.set(
 			title=self.name,
 			xlabel="Major axis / AU",
 			ylabel="Minor axis / AU",
 			aspect="equal",
 			facecolor=fc)
-		plt.legend(loc="upper right")
-		plt.grid(True)
-
-		def update(frame):
-			return ax
+		ax.legend(loc="upper right")
+		ax.grid(True)
 
 		if fname == "":
 			fname = f"../images/Task 2/{self.name}"
 
+		# a still picture: images are written directly, videos get one frame
+		fn = None
 		if f_ext == "":
 			plt.show()
-		else:
-			anim = FuncAnimation(fig=fig, func=update, frames=2, interval=1000)
+		elif f_ext in IMAGE_FORMATS:
 			fn = f"{fname}.{f_ext}"
-			anim.save(fn, writer="ffmpeg")
-			plt.close()
-			return fn
-		plt.close()
+			fig.savefig(fn)
+		else:
+			fn = save_stream(fig, lambda frame: None, 1, 1, f"{fname}.{f_ext}", progress)
+		close_figure(fig)
+		return fn
 
 	# ptols orbits with planet_c as fixed object
 	def ptol_orbits(self, ax, planet_c, yrs=1, main=False, fc="#000000"):
 		yrs *= planet_c.period
-		offset = planet_c.ptol_orbit(ax, rt=True, yrs=yrs)
 
 		if main is True:
 			for planet in self.planets:
 				if planet != planet_c:
-					planet.ptol_orbit(ax, offset=offset, yrs=yrs, lw=0.5, label=True)
+					planet.ptol_orbit(ax, centre=planet_c, yrs=yrs, lw=0.5, label=True)
 				else:
-					planet.ptol_orbit(ax, offset=offset, yrs=yrs, marker="o", label=True)
+					planet.ptol_orbit(ax, centre=planet_c, yrs=yrs, marker="o", label=True)
 		else:
 			for planet in self.planets:
 				if planet != planet_c:
-					planet.ptol_orbit(ax, offset=offset, yrs=yrs, lw=0.5)
+					planet.ptol_orbit(ax, centre=planet_c, yrs=yrs, lw=0.5)
 				else:
-					planet.ptol_orbit(ax, offset=offset, yrs=yrs, marker="o")
+					planet.ptol_orbit(ax, centre=planet_c, yrs=yrs, marker="o")
 
 		# plot star
 		if self.star is not None:
+			offset = planet_c.ptol_path(ax, yrs).T
 			ax.plot(
 				-offset[0],
 				-offset[1],
@@ -466,30 +1768,30 @@ k ≈ 1.5""",
 				facecolor=fc
 			)
 			ax.legend(loc="upper right")
-			plt.grid(True)
+			ax.grid(True)
 			plt.show()
-			plt.close()
+			close_figure(ax.figure)
 
 	# ptols 3d orbits with planet_c as fixed object
 	def ptol_orbits_3d(self, ax, planet_c, yrs=1, main=False, fc="#000000"):
 		yrs *= planet_c.period
-		offset = planet_c.ptol_orbit_3d(ax, rt=True, yrs=yrs)
 
 		if main is True:
 			for planet in self.planets:
 				if planet != planet_c:
-					planet.ptol_orbit_3d(ax, offset=offset, yrs=yrs, lw=0.5, label=True)
+					planet.ptol_orbit_3d(ax, centre=planet_c, yrs=yrs, lw=0.5, label=True)
 				else:
-					planet.ptol_orbit_3d(ax, offset=offset, yrs=yrs, marker="o", label=True)
+					planet.ptol_orbit_3d(ax, centre=planet_c, yrs=yrs, marker="o", label=True)
 		else:
 			for planet in self.planets:
 				if planet != planet_c:
-					planet.ptol_orbit_3d(ax, offset=offset, yrs=yrs, lw=0.5)
+					planet.ptol_orbit_3d(ax, centre=planet_c, yrs=yrs, lw=0.5)
 				else:
-					planet.ptol_orbit_3d(ax, offset=offset, yrs=yrs, marker="o")
+					planet.ptol_orbit_3d(ax, centre=planet_c, yrs=yrs, marker="o")
 
 		# plot star
 		if self.star is not None:
+			offset = planet_c.ptol_path(ax, yrs, three_d=True).T
 			ax.plot(
 				-offset[0],
 				-offset[1],
@@ -506,22 +1808,34 @@ k ≈ 1.5""",
 				facecolor=fc
 			)
 			ax.legend(loc="upper right")
-			plt.grid(True)
+			ax.grid(True)
 			plt.show()
-			plt.close()
+			close_figure(ax.figure)
 
 	# animates all orbits of planets in system
 	# takes argument of which planet the years should be counted in
 	# expects a planet object
-	def animate_orbits(self, planet_y, yrs=1, fc="#333333", f_ext="", fname=""):
+	def animate_orbits(
+		self,
+		planet_y,
+		yrs=1,
+		fc="#333333",
+		f_ext="",
+		fname="",
+		workers=1,
+		progress=None,
+		preview=False,
+		budget=None
+	):
 		period = planet_y.period
 		years = yrs * self.planets[-1].period / period
-		i = 20
-		frames = int((1000 / i) * years)
 		lim = period * years
+		frames, i = (budget or RenderBudget()).plan(lim, years)
 		time = np.linspace(0, lim, frames + 1)
+		pos = self.trajectories(time)
 		plots = []
-		fig, ax = plt.subplots()
+		fig = new_figure(f_ext)
+		ax = fig.add_subplot()
 		if self.star is not None:
 			ax.scatter(
 				0,
@@ -530,15 +1844,11 @@ k ≈ 1.5""",
 				c=self.star.color,
 				marker=self.star.marker,
 				label=self.star.name)
-		for planet in self.planets:
-			planet.plot_orbit()
+		for c, planet in enumerate(self.planets):
+			planet.plot_orbit(ax=ax)
 			a = planet.sm_axis
 			e = planet.eccentricity
-
-			theta, r = kepler_eq(time[0], a, planet.period, e)
-
-			x = r * np.cos(theta)
-			y = r * np.sin(theta)
+			x, y = pos[c, 0, :2]
 			p = ax.scatter(x, y, s=20, label=planet.name)
 			plots.append(p)
 			ax.set(
@@ -550,22 +1860,19 @@ k ≈ 1.5""",
 				facecolor=fc)
 			ax.legend(loc="upper right")
 
-		def update(frame):
-			ax.set(
-				title=f"{self.name}: t={time[frame] / period:.3f} {planet_y.name} years")
-			for c, planet in enumerate(self.planets):
-				a = planet.sm_axis
-				e = planet.eccentricity
+		belts = self.scatter_populations(ax)
 
-				theta, r = kepler_eq(time[frame], a, planet.period, e)
+		ax.set_title(self.name)
+		label = time_label(ax, fc)
 
-				x = r * np.cos(theta)
-				y = r * np.sin(theta)
-				data = np.stack([x, y]).T
-				plots[c].set_offsets(data)
-			return tuple(plots)
+		def update(frame):
+			label.set_text(f"t={time[frame] / period:.3f} {planet_y.name} years")
+			for c, p in enumerate(plots):
+				p.set_offsets(pos[c, frame, :2])
+			for population, b in zip(self.populations, belts):
+				population.update(b, time[frame])
+			return (*plots, *belts, label)
 
-		anim = FuncAnimation(fig=fig, func=update, frames=frames, interval=i)
 		n = planet_y.name
 		w = ""
 		if yrs != 1:
@@ -574,18 +1881,11 @@ k ≈ 1.5""",
 		if fname == "":
 			fname = f"../images/Task 3/{self.name} Orbits with {w}{n} Years"
 
-		if f_ext == "":
-			plt.grid(True)
-			plt.show()
-		elif f_ext == "html":
-			with open(f"{fname}.html", "w") as f:
-				print(anim.to_html5_video(), file=f)
-		else:
-			fn = f"{fname}.{f_ext}"
-			anim.save(fn, writer="ffmpeg")
-			plt.close()
-			return fn
-		plt.close()
+		return output(
+			fig, update, frames, i, f_ext, fname, workers=workers,
+			progress=progress,
+			preview=preview,
+			job=(self, "animate_orbits", (planet_y, yrs, fc), {"budget": budget}))
 
 	def ptolemate(
 		self,
@@ -594,25 +1894,24 @@ k ≈ 1.5""",
 		yrs=1,
 		fc="#333333",
 		f_ext="",
-		fname=""
+		fname="",
+		workers=1,
+		progress=None,
+		preview=False,
+		budget=None
 	):
 		period = planet_y.period
-		i = 20
-		frames = int((1000 / i) * yrs)
 		lim = period * yrs
+		frames, i = (budget or RenderBudget()).plan(lim, yrs)
 		time = np.linspace(0, lim, frames + 1)
+		pos = self.relative(planet_c, time)
 		plots = []
-		fig, ax = plt.subplots()
+		fig = new_figure(f_ext)
+		ax = fig.add_subplot()
 		self.ptol_orbits(ax, planet_c, lim / planet_c.period)
 
-		for planet in self.planets:
-			a = planet.sm_axis
-			e = planet.eccentricity
-
-			theta, r = kepler_eq(time[0], a, planet.period, e)
-			offset = planet_c.ptol_orbit(ax, yrs=lim, sp=frames + 1, rt=True)
-			x = r * np.cos(theta) - offset[0][0]
-			y = r * np.sin(theta) - offset[1][0]
+		for c, planet in enumerate(self.planets):
+			x, y = pos[c, 0, :2]
 			p = ax.scatter(x, y, s=20, label=planet.name)
 			plots.append(p)
 			ax.set(
@@ -622,23 +1921,15 @@ k ≈ 1.5""",
 				facecolor=fc)
 			ax.legend(loc="upper right")
 
-		def update(frame):
-			ax.set(
-				title=f"{self.name}: t={time[frame] / period:.3f} {planet_y.name} years")
-			offset = planet_c.ptol_orbit(ax, yrs=lim, sp=frames + 1, rt=True)
-			for c, planet in enumerate(self.planets):
-				a = planet.sm_axis
-				e = planet.eccentricity
+		ax.set_title(self.name)
+		label = time_label(ax, fc)
 
-				theta, r = kepler_eq(time[frame], a, planet.period, e)
-
-				x = r * np.cos(theta) - offset[0][frame]
-				y = r * np.sin(theta) - offset[1][frame]
-				data = np.stack([x, y]).T
-				plots[c].set_offsets(data)
-			return tuple(plots)
+		def update(frame):
+			label.set_text(f"t={time[frame] / period:.3f} {planet_y.name} years")
+			for c, p in enumerate(plots):
+				p.set_offsets(pos[c, frame, :2])
+			return (*plots, label)
 
-		anim = FuncAnimation(fig=fig, func=update, frames=frames, interval=i)
 		n = planet_y.name
 		w = ""
 		if yrs != 1:
@@ -648,18 +1939,11 @@ k ≈ 1.5""",
 			c = planet_c.name
 			fname = f"../images/Task 7/{self.name} relative to {c} {w}{n} years"
 
-		if f_ext == "":
-			plt.grid(True)
-			plt.show()
-		elif f_ext == "html":
-			with open(f"{fname}.html", "w") as f:
-				print(anim.to_html5_video(), file=f)
-		else:
-			fn = f"{fname}.{f_ext}"
-			anim.save(fn, writer="ffmpeg")
-			plt.close()
-			return fn
-		plt.close()
+		return output(
+			fig, update, frames, i, f_ext, fname, workers=workers,
+			progress=progress,
+			preview=preview,
+			job=(self, "ptolemate", (planet_y, planet_c, yrs, fc), {"budget": budget}))
 
 	def animate_orbits_3d(
 		self,
@@ -667,16 +1951,20 @@ k ≈ 1.5""",
 		yrs=1,
 		fc="#333333",
 		f_ext="",
-		fname=""
+		fname="",
+		workers=1,
+		progress=None,
+		preview=False,
+		budget=None
 	):
 		period = planet_y.period
 		years = yrs * self.planets[-1].period / period
-		i = 20
-		frames = int((1000 / i) * years)
 		lim = period * years
+		frames, i = (budget or RenderBudget()).plan(lim, years)
 		time = np.linspace(0, lim, frames + 1)
+		pos = self.trajectories(time, three_d=True)
 		plots = []
-		fig = plt.figure()
+		fig = new_figure(f_ext)
 		ax = fig.add_subplot(111, projection="3d")
 		if self.star is not None:
 			ax.scatter(
@@ -687,16 +1975,11 @@ k ≈ 1.5""",
 				c=self.star.color,
 				marker=self.star.marker,
 				label=self.star.name)
-		for planet in self.planets:
+		for c, planet in enumerate(self.planets):
 			planet.plot_orbit_3d(fig, ax)
 			a = planet.sm_axis
 			e = planet.eccentricity
-
-			theta, r = kepler_eq(time[0], a, planet.period, e)
-
-			x = r * np.cos(theta) * np.cos(np.deg2rad(planet.inclination))
-			y = r * np.sin(theta)
-			z = r * np.cos(theta) * np.sin(np.deg2rad(planet.inclination))
+			x, y, z = pos[c, 0]
 			p = ax.scatter(x, y, z, label=planet.name)
 			plots.append(p)
 			ax.set(
@@ -709,24 +1992,20 @@ k ≈ 1.5""",
 				facecolor=fc)
 			ax.legend(loc="upper right")
 
+		belts = self.scatter_populations(ax, three_d=True)
+
+		ax.set_title(self.name)
+		label = time_label(ax, fc)
+
 		def update(frame):
-			ax.set(
-				title=f"{self.name}: t={time[frame] / period:.3f} {planet_y.name} years")
-			for c, planet in enumerate(self.planets):
-				a = planet.sm_axis
-				e = planet.eccentricity
-
-				theta, r = kepler_eq(time[frame], a, planet.period, e)
-
-				x = r * np.cos(theta) * np.cos(np.deg2rad(planet.inclination))
-				y = r * np.sin(theta)
-				z = r * np.cos(theta) * np.sin(np.deg2rad(planet.inclination))
-				data = np.stack([x, y]).T
-				plots[c].set_offsets(data)
-				plots[c].set_3d_properties(z, "z")
-			return tuple(plots)
-
-		anim = FuncAnimation(fig=fig, func=update, frames=frames, interval=i)
+			label.set_text(f"t={time[frame] / period:.3f} {planet_y.name} years")
+			for c, p in enumerate(plots):
+				p.set_offsets(pos[c, frame, :2])
+				p.set_3d_properties(pos[c, frame, 2], "z")
+			for population, b in zip(self.populations, belts):
+				population.update(b, time[frame], three_d=True)
+			return (*plots, *belts, label)
+
 		n = planet_y.name
 		w = ""
 		if yrs != 1:
@@ -735,18 +2014,11 @@ k ≈ 1.5""",
 		if fname == "":
 			fname = f"../images/Task 4/{self.name} Orbits 3D with {w}{n} Years"
 
-		if f_ext == "":
-			plt.grid(True)
-			plt.show()
-		elif f_ext == "html":
-			with open(f"{fname}.html", "w") as f:
-				print(anim.to_html5_video(), file=f)
-		else:
-			fn = f"{fname}.{f_ext}"
-			anim.save(fn, writer="ffmpeg")
-			plt.close()
-			return fn
-		plt.close()
+		return output(
+			fig, update, frames, i, f_ext, fname, workers=workers,
+			progress=progress,
+			preview=preview,
+			job=(self, "animate_orbits_3d", (planet_y, yrs, fc), {"budget": budget}))
 
 	def ptolemate_3d(
 		self,
@@ -755,27 +2027,24 @@ k ≈ 1.5""",
 		yrs=1,
 		fc="#333333",
 		f_ext="",
-		fname=""
+		fname="",
+		workers=1,
+		progress=None,
+		preview=False,
+		budget=None
 	):
 		period = planet_y.period
-		i = 20
-		frames = int((1000 / i) * yrs)
 		lim = period * yrs
+		frames, i = (budget or RenderBudget()).plan(lim, yrs)
 		time = np.linspace(0, lim, frames + 1)
+		pos = self.relative(planet_c, time, three_d=True)
 		plots = []
-		fig = plt.figure()
+		fig = new_figure(f_ext)
 		ax = fig.add_subplot(111, projection="3d")
 		self.ptol_orbits_3d(ax, planet_c, lim / planet_c.period)
 
-		for planet in self.planets:
-			a = planet.sm_axis
-			e = planet.eccentricity
-			inc = planet.inclination
-			theta, r = kepler_eq(time[0], a, planet.period, e)
-			offset = planet_c.ptol_orbit_3d(ax, yrs=lim, sp=frames + 1, rt=True)
-			x = r * np.cos(theta) * np.cos(np.deg2rad(inc)) - offset[0][0]
-			y = r * np.sin(theta) - offset[1][0]
-			z = r * np.cos(theta) * np.sin(np.deg2rad(inc)) - offset[2][0]
+		for c, planet in enumerate(self.planets):
+			x, y, z = pos[c, 0]
 			p = ax.scatter(x, y, z, label=planet.name)
 			plots.append(p)
 			ax.set(
@@ -785,25 +2054,16 @@ k ≈ 1.5""",
 				facecolor=fc)
 			ax.legend(loc="upper right")
 
+		ax.set_title(self.name)
+		label = time_label(ax, fc)
+
 		def update(frame):
-			ax.set(
-				title=f"{self.name}: t={time[frame] / period:.3f} {planet_y.name} years")
-			offset = planet_c.ptol_orbit_3d(ax, yrs=lim, sp=frames + 1, rt=True)
-			for c, planet in enumerate(self.planets):
-				a = planet.sm_axis
-				e = planet.eccentricity
-				inc = planet.inclination
-				theta, r = kepler_eq(time[frame], a, planet.period, e)
-
-				x = r * np.cos(theta) * np.cos(np.deg2rad(inc)) - offset[0][frame]
-				y = r * np.sin(theta) - offset[1][frame]
-				z = r * np.cos(theta) * np.sin(np.deg2rad(inc)) - offset[2][frame]
-				data = np.stack([x, y]).T
-				plots[c].set_offsets(data)
-				plots[c].set_3d_properties(z, "z")
-			return tuple(plots)
-
-		anim = FuncAnimation(fig=fig, func=update, frames=frames, interval=i)
+			label.set_text(f"t={time[frame] / period:.3f} {planet_y.name} years")
+			for c, p in enumerate(plots):
+				p.set_offsets(pos[c, frame, :2])
+				p.set_3d_properties(pos[c, frame, 2], "z")
+			return (*plots, label)
+
 		n = planet_y.name
 		w = ""
 		if yrs != 1:
@@ -813,18 +2073,11 @@ k ≈ 1.5""",
 			x = planet_c.name
 			fname = f"../images/Task 7/{self.name} relative to {x} with {w}{n} Years 3D"
 
-		if f_ext == "":
-			plt.grid(True)
-			plt.show()
-		elif f_ext == "html":
-			with open(f"{fname}.html", "w") as f:
-				print(anim.to_html5_video(), file=f)
-		else:
-			fn = f"{fname}.{f_ext}"
-			anim.save(fn, writer="ffmpeg")
-			plt.close()
-			return fn
-		plt.close()
+		return output(
+			fig, update, frames, i, f_ext, fname, workers=workers,
+			progress=progress,
+			preview=preview,
+			job=(self, "ptolemate_3d", (planet_y, planet_c, yrs, fc), {"budget": budget}))
 
 	def spirograph(
 		self,
@@ -833,16 +2086,21 @@ k ≈ 1.5""",
 		fc="#000000",
 		f_ext="",
 		line=False,
-		fname=""
+		fname="",
+		workers=1,
+		progress=None,
+		preview=False,
+		budget=None
 	):
 		period = planet_y.period
 		years = yrs * self.planets[-1].period / period
-		i = 20
-		frames = int((1000 / i) * years)
 		lim = period * years
+		frames, i = (budget or RenderBudget()).plan(lim, years)
 		time = np.linspace(0, lim, frames + 1)
+		pos = self.trajectories(time)
 		plots = []
-		fig, ax = plt.subplots()
+		fig = new_figure(f_ext)
+		ax = fig.add_subplot()
 		if self.star is not None:
 			ax.scatter(
 				0,
@@ -851,20 +2109,12 @@ k ≈ 1.5""",
 				c=self.star.color,
 				marker=self.star.marker,
 				label=self.star.name)
-		x_array = []
-		y_array = []
-		for planet in self.planets:
+		for c, planet in enumerate(self.planets):
 			if line is True:
-				planet.plot_orbit()
+				planet.plot_orbit(ax=ax)
 			a = planet.sm_axis
 			e = planet.eccentricity
-
-			theta, r = kepler_eq(time[0], a, planet.period, e)
-
-			x = r * np.cos(theta)
-			y = r * np.sin(theta)
-			x_array.append(x)
-			y_array.append(y)
+			x, y = pos[c, 0, :2]
 			p = ax.scatter(x, y, s=20, label=planet.name)
 			plots.append(p)
 			ax.set(
@@ -875,32 +2125,17 @@ k ≈ 1.5""",
 				ylim=[-a * (e + 1) * 1.2, a * (e + 1) * 1.2],
 				facecolor=fc)
 			ax.legend(loc="upper right")
+		lines = SpirographLines(ax, pos, colors="w", linewidths=0.5, alpha=0.2)
+
+		ax.set_title(self.name)
+		label = time_label(ax, fc)
 
 		def update(frame):
-			ax.set(
-				title=f"{self.name}: t={time[frame] / period:.3f} {planet_y.name} years")
-			v = []
-			w = []
-			for c, planet in enumerate(self.planets):
-				a = planet.sm_axis
-				e = planet.eccentricity
-
-				theta, r = kepler_eq(time[frame], a, planet.period, e)
-
-				x = r * np.cos(theta)
-				y = r * np.sin(theta)
-				v.append(x)
-				w.append(y)
-				data = np.stack([x, y]).T
-				plots[c].set_offsets(data)
-			for b in range(len(v)):
-				for d in range(len(v)):
-					ax.plot(
-						[v[b], v[d]], [w[b], w[d]], "-w", lw="0.5", alpha=0.2)
-
-			return tuple(plots)
-
-		anim = FuncAnimation(fig=fig, func=update, frames=frames, interval=i)
+			label.set_text(f"t={time[frame] / period:.3f} {planet_y.name} years")
+			for c, p in enumerate(plots):
+				p.set_offsets(pos[c, frame, :2])
+			return (*plots, *lines.update(frame), label)
+
 		temp = ""
 		for u in self.planets:
 			temp += u.name + "-"
@@ -916,17 +2151,11 @@ k ≈ 1.5""",
 		if fname == "":
 			fname = f"../images/Task 6/{temp} Spirograph with {w}{n} years{v}"
 
-		if f_ext == "":
-			plt.show()
-		elif f_ext == "html":
-			with open(f"{fname}.html", "w") as f:
-				print(anim.to_html5_video(), file=f)
-		else:
-			fn = f"{fname}.{f_ext}"
-			anim.save(fn, writer="ffmpeg")
-			plt.close()
-			return fn
-		plt.close()
+		return output(
+			fig, update, frames, i, f_ext, fname, grid=False, workers=workers,
+			progress=progress,
+			preview=preview,
+			job=(self, "spirograph", (planet_y, yrs, fc), {"line": line, "budget": budget}))
 
 	def spirograph_3d(
 		self,
@@ -935,16 +2164,20 @@ k ≈ 1.5""",
 		fc="#000000",
 		f_ext="",
 		line=False,
-		fname=""
+		fname="",
+		workers=1,
+		progress=None,
+		preview=False,
+		budget=None
 	):
 		period = planet_y.period
 		years = yrs * self.planets[-1].period / period
-		i = 20
-		frames = int((1000 / i) * years)
 		lim = period * years
+		frames, i = (budget or RenderBudget()).plan(lim, years)
 		time = np.linspace(0, lim, frames + 1)
+		pos = self.trajectories(time, three_d=True)
 		plots = []
-		fig = plt.figure()
+		fig = new_figure(f_ext)
 		ax = fig.add_subplot(111, projection="3d")
 		if self.star is not None:
 			ax.scatter(
@@ -955,23 +2188,12 @@ k ≈ 1.5""",
 				c=self.star.color,
 				marker=self.star.marker,
 				label=self.star.name)
-		x_array = []
-		y_array = []
-		z_array = []
-		for planet in self.planets:
+		for c, planet in enumerate(self.planets):
 			if line is True:
 				planet.plot_orbit_3d(fig, ax)
 			a = planet.sm_axis
 			e = planet.eccentricity
-
-			theta, r = kepler_eq(time[0], a, planet.period, e)
-
-			x = r * np.cos(theta) * np.cos(np.deg2rad(planet.inclination))
-			y = r * np.sin(theta)
-			z = r * np.cos(theta) * np.sin(np.deg2rad(planet.inclination))
-			x_array.append(x)
-			y_array.append(y)
-			z_array.append(z)
+			x, y, z = pos[c, 0]
 			p = ax.scatter(x, y, z, s=20, label=planet.name)
 			plots.append(p)
 			ax.set(
@@ -984,36 +2206,19 @@ k ≈ 1.5""",
 				zlim=[-a * (e + 1) * 1.2, a * (e + 1) * 1.2],
 				facecolor=fc)
 			ax.legend(loc="upper right")
+		lines = SpirographLines(
+			ax, pos, three_d=True, colors="w", linewidths=0.5, alpha=0.2)
+
+		ax.set_title(self.name)
+		label = time_label(ax, fc)
 
 		def update(frame):
-			ax.set(
-				title=f"{self.name}: t={time[frame] / period:.3f} {planet_y.name} years")
-			v = []
-			w = []
-			u = []
-			for c, planet in enumerate(self.planets):
-				a = planet.sm_axis
-				e = planet.eccentricity
-
-				theta, r = kepler_eq(time[frame], a, planet.period, e)
-
-				x = r * np.cos(theta) * np.cos(np.deg2rad(planet.inclination))
-				y = r * np.sin(theta)
-				z = r * np.cos(theta) * np.sin(np.deg2rad(planet.inclination))
-				v.append(x)
-				w.append(y)
-				u.append(z)
-				data = np.stack([x, y]).T
-				plots[c].set_offsets(data)
-				plots[c].set_3d_properties(z, "z")
-			for b in range(len(v)):
-				for d in range(len(v)):
-					ax.plot(
-						[v[b], v[d]], [w[b], w[d]], [u[b], u[d]], "-w", lw="0.5", alpha=0.2)
-
-			return tuple(plots)
-
-		anim = FuncAnimation(fig=fig, func=update, frames=frames, interval=i)
+			label.set_text(f"t={time[frame] / period:.3f} {planet_y.name} years")
+			for c, p in enumerate(plots):
+				p.set_offsets(pos[c, frame, :2])
+				p.set_3d_properties(pos[c, frame, 2], "z")
+			return (*plots, *lines.update(frame), label)
+
 		temp = ""
 		for u in self.planets:
 			temp += u.name + "-"
@@ -1029,17 +2234,70 @@ k ≈ 1.5""",
 		if fname == "":
 			fname = f"../images/Task 6/{temp} Spirograph 3D with {w}{n} years{v}"
 
-		if f_ext == "":
-			plt.show()
-		elif f_ext == "html":
-			with open(f"{fname}.html", "w") as f:
-				print(anim.to_html5_video(), file=f)
-		else:
-			fn = f"{fname}.{f_ext}"
-			anim.save(fn, writer="ffmpeg")
-			plt.close()
-			return fn
-		plt.close()
+		return output(
+			fig, update, frames, i, f_ext, fname, grid=False, workers=workers,
+			progress=progress,
+			preview=preview,
+			job=(self, "spirograph_3d", (planet_y, yrs, fc), {"line": line, "budget": budget}))
+
+	# renders the final spirograph straight to a png, without animation
+	# all pair segments over the full span are rasterized with additive alpha
+	# yrs and planet_y match spirograph, d is samples per planet_y year
+	# res is the image width and height in pixels
+	def spirograph_image(
+		self,
+		planet_y,
+		yrs=10,
+		fc="#000000",
+		color="#FFFFFF",
+		alpha=0.2,
+		d=50,
+		res=2000,
+		line=False,
+		fname=""
+	):
+		period = planet_y.period
+		years = yrs * self.planets[-1].period / period
+		samples = int(d * years) + 1
+		lim = period * years
+		a = self.planets[-1].sm_axis
+		e = self.planets[-1].eccentricity
+		extent = a * (e + 1) * 1.2
+		scale = res / (2 * extent)  # pixels per AU
+		acc = np.zeros((res, res), dtype=np.float32)
+
+		# solve and rasterize in blocks of time so memory stays bounded
+		for block in np.array_split(np.arange(samples), max(samples // 10000, 1)):
+			first = block[0]
+			if first > 0:
+				block = np.r_[first - 1, block]  # overlap to join orbit lines
+			pos = self.trajectories(block * (lim / (samples - 1)))
+			px = np.empty(pos.shape[:2] + (2,))
+			px[..., 0] = (pos[..., 0] + extent) * scale
+			px[..., 1] = (extent - pos[..., 1]) * scale  # image rows run downwards
+			seg = pair_segments(px[:, 1:] if first > 0 else px)
+			rasterize_segments(seg.reshape(-1, 2, 2), acc.shape, alpha, out=acc)
+			if line is True:
+				orbit = np.stack([px[:, :-1], px[:, 1:]], axis=2)
+				rasterize_segments(orbit.reshape(-1, 2, 2), acc.shape, 0.8, out=acc)
+
+		cover = (1 - np.exp(-acc))[..., None]
+		img = (1 - cover) * mcolors.to_rgb(fc) + cover * mcolors.to_rgb(color)
+
+		temp = "-".join(u.name for u in self.planets)
+		n = planet_y.name
+		w = ""
+		if yrs != 1:
+			w = f"{years:.0f} "
+		v = ""
+		if line is True:
+			v = " and line"
+
+		if fname == "":
+			fname = f"../images/Task 6/{temp} Spirograph with {w}{n} years{v}"
+		fn = f"{fname}.png"
+		mpimg.imsave(fn, img)
+		return fn
 
 
 # define solar system planets using "solar system parameters"
@@ -1052,63 +2310,90 @@ mercury = Planet(
 	period=0.2410108701802479,
 	eccentricity=2.056354954960132E-01,
 	inclination=7.003585469292125E+00,
-	true_anomaly=1.889230396629393E+02)
+	true_anomaly=1.889230396629393E+02,
+	node=4.830104215875195E+01,
+	perihelion=2.919142669760689E+01,
+	mass=1.6601E-07)
 venus = Planet(
 	name="Venus",
 	sm_axis=0.72333967899011,
 	period=0.615628142197116,
 	eccentricity=6.753028854282829E-03,
 	inclination=3.394360369950776E+00,
-	true_anomaly=1.894673808209864E+02)
+	true_anomaly=1.894673808209864E+02,
+	node=7.661483337220002E+01,
+	perihelion=5.494633181657689E+01,
+	mass=2.4478E-06)
 earth = Planet(
 	name="Earth",
 	sm_axis=1.00073819677731,
 	period=1.001810605554546,
 	eccentricity=1.604364152762242E-02,
 	inclination=3.099622567228552E-03,
-	true_anomaly=2.186556906492948E+02)
+	true_anomaly=2.186556906492948E+02,
+	node=1.696274722782690E+02,
+	perihelion=2.923738324293872E+02,
+	mass=3.0035E-06)
 mars = Planet(
 	name="Mars",
 	sm_axis=1.52369722627954,
 	period=1.882146861200281,
 	eccentricity=9.334737917768475E-02,
 	inclination=1.847923133607658E+00,
-	true_anomaly=2.131590190014785E+02)
+	true_anomaly=2.131590190014785E+02,
+	node=4.948975272080387E+01,
+	perihelion=2.866377309616323E+02,
+	mass=3.2272E-07)
 jupiter = Planet(
 	name="Jupiter",
 	sm_axis=5.202378290208416,
 	period=11.86864846590255,
 	eccentricity=4.833431537183881E-02,
 	inclination=1.303626614600446E+00,
-	true_anomaly=1.886747335398515E+01)
+	true_anomaly=1.886747335398515E+01,
+	node=1.005121924616098E+02,
+	perihelion=2.734000008733377E+02,
+	mass=9.5479E-04)
 saturn = Planet(
 	name="Saturn",
 	sm_axis=9.57511052966961,
 	period=29.64552878472513,
 	eccentricity=5.409745026803753E-02,
 	inclination=2.488383924364373E+00,
-	true_anomaly=2.442738264723067E+02)
+	true_anomaly=2.442738264723067E+02,
+	node=1.136321482244775E+02,
+	perihelion=3.351983040685118E+02,
+	mass=2.8589E-04)
 uranus = Planet(
 	name="Uranus",
 	sm_axis=19.2960286599553,
 	period=84.8199448379608,
 	eccentricity=4.411720227915315E-02,
 	inclination=7.721283154484431E-01,
-	true_anomaly=2.441986196273190E+02)
+	true_anomaly=2.441986196273190E+02,
+	node=7.402965256754891E+01,
+	perihelion=9.146738427122686E+01,
+	mass=4.3662E-05)
 neptune = Planet(
 	name="Neptune",
 	sm_axis=30.27978943893903,
 	period=166.7338026736612,
 	eccentricity=1.450793663505559E-02,
 	inclination=1.768991920111643E+00,
-	true_anomaly=3.275592247377758E+02)
+	true_anomaly=3.275592247377758E+02,
+	node=1.317457583730918E+02,
+	perihelion=2.564256298028737E+02,
+	mass=5.1514E-05)
 pluto = Planet(
 	name="Pluto",
 	sm_axis=39.11030891229124,
 	period=244.7611191723939,
 	eccentricity=2.442251246317582E-01,
 	inclination=1.710818788574056E+01,
-	true_anomaly=7.675388171731849E+01)
+	true_anomaly=7.675388171731849E+01,
+	node=1.102967238097932E+02,
+	perihelion=1.122443124394196E+02,
+	mass=6.5500E-09)
 
 sun = Star("Sun", "o", "#FFE100", 100)
 
@@ -1136,3 +2421,52 @@ pre = [
 	neptune,
 	pluto
 ]
+
+
+# semi-major axis of the p:q mean motion resonance with planet, i.e. a body
+# completing p orbits while the planet completes q
+def resonance(planet, p, q):
+	return planet.sm_axis * (q / p) ** (2 / 3)
+
+
+# synthetic main asteroid belt of n bodies between 2.1 and 3.3 AU
+# bodies near jupiter's 3:1, 5:2, 7:3 and 2:1 resonances are left out, giving
+# the kirkwood gaps; eccentricities and inclinations are drawn around the
+# belt's typical 0.1 and 7 degrees, other angles are uniform
+def main_belt(n=100000, seed=0, gap=0.02, dtype=np.float32):
+	rng = np.random.default_rng(seed)
+	gaps = np.array([resonance(jupiter, p, q) for p, q in [(3, 1), (5, 2), (7, 3), (2, 1)]])
+	a = np.empty(0)
+	while a.size < n:
+		trial = rng.uniform(2.1, 3.3, n)
+		keep = np.all(np.abs(trial[:, None] - gaps) > gap, axis=1)
+		a = np.concatenate([a, trial[keep]])
+	return Population(
+		"Main Belt",
+		a[:n],
+		np.clip(rng.rayleigh(0.1, n), 0, 0.3),
+		inclination=rng.rayleigh(7, n),
+		node=rng.uniform(0, 360, n),
+		perihelion=rng.uniform(0, 360, n),
+		mean_anomaly=rng.uniform(0, 360, n),
+		dtype=dtype)
+
+
+# synthetic kuiper belt of n bodies: a third plutinos, in neptune's 2:3
+# resonance like pluto, and the rest classical objects between 42 and 48 AU
+def kuiper_belt(n=100000, seed=0, dtype=np.float32):
+	rng = np.random.default_rng(seed)
+	k = n // 3
+	a = np.concatenate([
+		resonance(neptune, 2, 3) + rng.normal(0, 0.2, k), rng.uniform(42, 48, n - k)])
+	e = np.concatenate([rng.uniform(0.1, 0.3, k), np.clip(rng.rayleigh(0.05, n - k), 0, 0.2)])
+	return Population(
+		"Kuiper Belt",
+		a,
+		e,
+		inclination=rng.rayleigh(5, n),
+		node=rng.uniform(0, 360, n),
+		perihelion=rng.uniform(0, 360, n),
+		mean_anomaly=rng.uniform(0, 360, n),
+		color="#7FA7C9",
+		dtype=dtype)